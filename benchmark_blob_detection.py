@@ -0,0 +1,96 @@
+"""Compare speed and accuracy of blob detection backends on synthetic masks."""
+
+import argparse
+import time
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from drums.blob_detection import BLOB_DETECTORS, create_blob_detector
+from drums.streaming import InputVideoStream
+
+
+#: Size of the synthetic masks (width, height)
+MASK_SIZE = (InputVideoStream.MAX_OUTPUT_IMAGE_WIDTH, 480)
+#: Range of radii of the controller blob [px]
+BLOB_RADIUS_RANGE = (8, 30)
+#: Maximal movement of the controller blob between two masks [px]
+MAX_MOVEMENT = 60
+#: Radius of noise specks [px]
+NOISE_RADIUS = 3
+
+
+def parse_arguments():
+    """Return parsed command line arguments as dictionary."""
+    parser = argparse.ArgumentParser(description='Blob detection benchmark.')
+    parser.add_argument('-n', '--masks_count', type=int, default=500,
+                        help='Number of synthetic masks.')
+    parser.add_argument('--noise_count', type=int, default=3,
+                        help='Number of noise specks in each mask.')
+    parser.add_argument('--min_area', type=int, default=50,
+                        help='Minimal blob area of backends [px].')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random generator.')
+
+    parsed_arguments = parser.parse_args()
+    arguments = vars(parsed_arguments)
+    return arguments
+
+
+def create_masks(masks_count: int, noise_count: int,
+                 seed: int) -> List[Tuple[np.ndarray, Tuple[int, int]]]:
+    """Return masks with a moving controller blob and noise, and the true blob centers."""
+    random_generator = np.random.RandomState(seed)
+    width, height = MASK_SIZE
+    center = np.array([width / 2, height / 2])
+    masks = []
+    for _ in range(masks_count):
+        center = np.clip(center + random_generator.uniform(-MAX_MOVEMENT, MAX_MOVEMENT, 2),
+                         BLOB_RADIUS_RANGE[1], np.array([width, height]) - BLOB_RADIUS_RANGE[1])
+        true_center = (int(center[0]), int(center[1]))
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.circle(mask, true_center, random_generator.randint(*BLOB_RADIUS_RANGE), 255, -1)
+        for _ in range(noise_count):
+            noise_center = (random_generator.randint(width), random_generator.randint(height))
+            cv2.circle(mask, noise_center, NOISE_RADIUS, 255, -1)
+        masks.append((mask, true_center))
+    return masks
+
+
+def benchmark_blob_detector(name: str, min_area: int,
+                            masks: List[Tuple[np.ndarray, Tuple[int, int]]]) -> Tuple[float, ...]:
+    """Return time per mask [ms], mean and maximal error [px] and misses of the backend."""
+    blob_detector = create_blob_detector(name, min_area)
+    previous_position = None
+    errors = []
+    misses_count = 0
+    start_time = time.perf_counter()
+    for mask, true_center in masks:
+        position = blob_detector.get_center(mask, previous_position)
+        if position is None:
+            misses_count += 1
+        else:
+            errors.append(np.linalg.norm(np.subtract(position, true_center)))
+        previous_position = position
+    time_per_mask = (time.perf_counter() - start_time) / len(masks) * 1000
+    errors = errors or [float('nan')]
+    return time_per_mask, float(np.mean(errors)), float(np.max(errors)), misses_count
+
+
+def start_benchmark():
+    """Run all blob detection backends on the same synthetic masks and print results."""
+    arguments = parse_arguments()
+    masks = create_masks(arguments['masks_count'], arguments['noise_count'], arguments['seed'])
+
+    print(f'{"Backend":<22}{"Time [ms]":>10}{"Mean error [px]":>17}'
+          f'{"Max error [px]":>16}{"Misses":>8}')
+    for name in BLOB_DETECTORS:
+        time_per_mask, mean_error, max_error, misses_count = benchmark_blob_detector(
+            name, arguments['min_area'], masks)
+        print(f'{name:<22}{time_per_mask:>10.3f}{mean_error:>17.2f}'
+              f'{max_error:>16.2f}{misses_count:>8}')
+
+
+if __name__ == '__main__':
+    start_benchmark()
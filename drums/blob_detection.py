@@ -0,0 +1,135 @@
+"""Detection of controller blobs in masks."""
+
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class BlobDetector:
+    """Base class of blob detection backends.
+
+    Backend returns center of the controller blob in the binary mask,
+    blobs smaller than ``min_area`` are ignored. The area is the number of blob pixels,
+    except for ``ContoursBlobDetector``, which uses the area inside the blob outline
+    (a bit smaller, the outline pixels are counted only partly).
+
+    The ``min_area`` is in pixels of the full resolution mask. If the mask is
+    downscaled by ``scale``, the areas and distances are scaled with it.
+    """
+
+    #: Minimal area of blob [px]
+    MIN_AREA = 0
+
+    def __init__(self, min_area: int = MIN_AREA):
+        #: Minimal area of blob in the full resolution mask [px]
+        self.min_area = min_area
+
+    def get_center(self, mask: np.ndarray, previous_position: Tuple[int, int] = None,
+                   scale: float = 1) -> Optional[Tuple[int, int]]:
+        """Return center of blob in mask or None if there is no blob."""
+        raise NotImplementedError
+
+    def get_min_area(self, scale: float = 1) -> float:
+        """Return minimal area of blob in the mask scaled by ``scale``."""
+        return self.min_area * scale ** 2
+
+
+class ContoursBlobDetector(BlobDetector):
+    """Center of the largest external contour."""
+
+    def get_center(self, mask: np.ndarray, previous_position: Tuple[int, int] = None,
+                   scale: float = 1) -> Optional[Tuple[int, int]]:
+        """Return center of the largest contour in mask."""
+        # Find contours in the mask
+        contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours = contours[-2]
+        if not contours:
+            return None
+
+        # Get the center of the largest contour
+        areas = [cv2.contourArea(contour) for contour in contours]
+        largest_index = int(np.argmax(areas))
+        if areas[largest_index] < max(self.get_min_area(scale), np.finfo(float).eps):
+            return None
+        centroid_moments = cv2.moments(contours[largest_index])
+        return (int(centroid_moments['m10'] / centroid_moments['m00']),
+                int(centroid_moments['m01'] / centroid_moments['m00']))
+
+
+class ConnectedComponentsBlobDetector(BlobDetector):
+    """Centroid of the largest connected component.
+
+    Labels all components and computes their areas and centroids in one pass.
+    """
+
+    def get_center(self, mask: np.ndarray, previous_position: Tuple[int, int] = None,
+                   scale: float = 1) -> Optional[Tuple[int, int]]:
+        """Return centroid of the largest connected component in mask."""
+        components_count, _, stats, centroids = cv2.connectedComponentsWithStats(
+            mask, connectivity=8)
+        # The first component is the background
+        if components_count < 2:
+            return None
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        largest_index = int(np.argmax(areas))
+        if areas[largest_index] < max(self.get_min_area(scale), 1):
+            return None
+        centroid = centroids[largest_index + 1]
+        return int(centroid[0]), int(centroid[1])
+
+
+class MomentsBlobDetector(BlobDetector):
+    """Centroid of all mask pixels in region of interest.
+
+    The region of interest is a window around the previous position of controller,
+    or the whole mask if the previous position is unknown. There is no segmentation
+    into blobs, so it is the cheapest backend, but noise in the window shifts the center.
+    """
+
+    #: Half of the size of region of interest around the previous position
+    #: in the full resolution mask [px]
+    ROI_HALF_SIZE = 80
+
+    def get_center(self, mask: np.ndarray, previous_position: Tuple[int, int] = None,
+                   scale: float = 1) -> Optional[Tuple[int, int]]:
+        """Return centroid of mask pixels around the previous position."""
+        min_area = max(self.get_min_area(scale), 1)
+        offset_x, offset_y = 0, 0
+        if previous_position is not None:
+            roi_half_size = int(MomentsBlobDetector.ROI_HALF_SIZE * scale)
+            offset_x = max(previous_position[0] - roi_half_size, 0)
+            offset_y = max(previous_position[1] - roi_half_size, 0)
+            roi = mask[offset_y:previous_position[1] + roi_half_size,
+                       offset_x:previous_position[0] + roi_half_size]
+            centroid_moments = cv2.moments(roi, binaryImage=True)
+            if centroid_moments['m00'] < min_area:
+                # The controller left the window, search in the whole mask
+                offset_x, offset_y = 0, 0
+                centroid_moments = cv2.moments(mask, binaryImage=True)
+        else:
+            centroid_moments = cv2.moments(mask, binaryImage=True)
+
+        if centroid_moments['m00'] < min_area:
+            return None
+        return (int(centroid_moments['m10'] / centroid_moments['m00']) + offset_x,
+                int(centroid_moments['m01'] / centroid_moments['m00']) + offset_y)
+
+
+#: Blob detection backends by their names in settings
+BLOB_DETECTORS = {
+    'contours': ContoursBlobDetector,
+    'connected_components': ConnectedComponentsBlobDetector,
+    'moments': MomentsBlobDetector,
+}
+
+
+def create_blob_detector(name: str = 'contours',
+                         min_area: int = BlobDetector.MIN_AREA) -> BlobDetector:
+    """Return blob detection backend by its name in settings."""
+    try:
+        blob_detector_class = BLOB_DETECTORS[name]
+    except KeyError as error:
+        raise ValueError(f'Unknown blob detection backend {name!r}, '
+                         f'use one of {", ".join(BLOB_DETECTORS)}.') from error
+    return blob_detector_class(min_area)
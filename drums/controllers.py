@@ -8,13 +8,48 @@ from typing import List, Tuple, Iterator, Any, Dict
 import cv2
 import numpy as np
 
+from drums.blob_detection import BlobDetector, ContoursBlobDetector
 from drums.frame import Frame
 from drums.streaming import InputVideoStream, OutputVideoStream
 
 LOG = logging.getLogger(__name__)
 
 
-class HSV(namedtuple('HSV', 'hue saturation value')):
+class Color:
+    """Mixin with element-wise arithmetic of colors limited to their color space."""
+
+    #: Minimum color
+    MINIMUM = ()
+    #: Maximum color
+    MAXIMUM = ()
+
+    __slots__ = ()
+
+    def __add__(self, other: 'Color') -> 'Color':
+        """Return element-wise sum. Cannot exceed maximum."""
+        return self.minimum(type(self)(*np.add(self, other)), type(self)(*self.MAXIMUM))
+
+    def __sub__(self, other: 'Color') -> 'Color':
+        """Return element-wise difference. Cannot exceed minimum."""
+        return self.maximum(type(self)(*np.subtract(self, other)), type(self)(*self.MINIMUM))
+
+    @classmethod
+    def minimum(cls, color_1: 'Color', color_2: 'Color') -> 'Color':
+        """Return element-wise minimum of both colors."""
+        return cls(*(np.minimum(color_1, color_2)).tolist())
+
+    @classmethod
+    def maximum(cls, color_1: 'Color', color_2: 'Color') -> 'Color':
+        """Return element-wise maximum of both colors."""
+        return cls(*(np.maximum(color_1, color_2)).tolist())
+
+    def to_save_format(self) -> List[int]:
+        """Transform color to format for saving to settings file."""
+        # The mixin is used only with namedtuples, which are iterable
+        return [int(number) for number in self]  # pylint: disable=not-an-iterable
+
+
+class HSV(Color, namedtuple('HSV', 'hue saturation value')):
     """Data class representing HSV color."""
 
     #: Minimum HSV color
@@ -24,27 +59,23 @@ class HSV(namedtuple('HSV', 'hue saturation value')):
 
     __slots__ = ()
 
-    def __add__(self, other: 'HSV') -> 'HSV':
-        """Return element-wise sum. Cannot exceed maximum."""
-        return HSV.minimum(HSV(*np.add(self, other)), HSV(*HSV.MAXIMUM))
 
-    def __sub__(self, other: 'HSV') -> 'HSV':
-        """Return element-wise difference. Cannot exceed minimum."""
-        return HSV.maximum(HSV(*np.subtract(self, other)), HSV(*HSV.MINIMUM))
+class YCrCb(Color, namedtuple('YCrCb', 'luma chroma_red chroma_blue')):
+    """Data class representing YCrCb color (YUV of cameras with swapped chroma channels)."""
 
-    @staticmethod
-    def minimum(hsv_1: 'HSV', hsv_2: 'HSV') -> 'HSV':
-        """Return element-wise minimum of both HSV."""
-        return HSV(*(np.minimum(hsv_1, hsv_2)).tolist())
+    #: Minimum YCrCb color
+    MINIMUM = (0, 0, 0)
+    #: Maximum YCrCb color
+    MAXIMUM = (255, 255, 255)
 
-    @staticmethod
-    def maximum(hsv_1: 'HSV', hsv_2: 'HSV') -> 'HSV':
-        """Return element-wise maximum of both HSV."""
-        return HSV(*(np.maximum(hsv_1, hsv_2)).tolist())
+    __slots__ = ()
 
-    def to_save_format(self) -> List[int]:
-        """Transform HSV to format for saving to settings file."""
-        return [int(number) for number in self]
+
+#: Color bounds for detecting controller in BGR frames (in HSV) and in YCrCb frames.
+#: The default bounds are empty, they do not detect any color.
+ColorRange = namedtuple('ColorRange', 'hsv_low hsv_high ycrcb_low ycrcb_high',
+                        defaults=(HSV(*HSV.MAXIMUM), HSV(*HSV.MINIMUM),
+                                  YCrCb(*YCrCb.MAXIMUM), YCrCb(*YCrCb.MINIMUM)))
 
 
 class Controller:
@@ -53,17 +84,17 @@ class Controller:
     #: Maximal length of the position queue
     DEQUE_MAX_LENGTH = 50
 
-    def __init__(self, key: str, name: str = None,
-                 color_low: HSV = HSV(*HSV.MAXIMUM), color_high: HSV = HSV(*HSV.MINIMUM),
-                 velocity_max_volume: int = 2000):
+    def __init__(self, key: str, name: str = None, color_range: ColorRange = ColorRange(),
+                 velocity_max_volume: int = 2000, source: str = None,
+                 blob_detector: BlobDetector = None):
         #: Unique key for controller
         self.key = key
         #: Name of controller
         self.name = name
-        #: Low color bound for detecting controller
-        self.color_low = color_low
-        #: High color bound for detecting controller
-        self.color_high = color_high
+        #: Key of the capture source in which the controller is tracked
+        self.source = source
+        #: Color bounds for detecting controller
+        self.color_range = color_range
         #: Queue with positions in time for velocity and acceleration calculation
         self.positions_in_time = deque(maxlen=Controller.DEQUE_MAX_LENGTH)
         #: Current position of controller in image
@@ -72,6 +103,8 @@ class Controller:
         self.velocity = None
         #: Controller's velocity that will play with maximal volume [px/s]
         self.velocity_max_volume = velocity_max_volume
+        #: Backend detecting controller's blob in mask
+        self.blob_detector = blob_detector or ContoursBlobDetector()
 
     def refresh_motion_attributes(self):
         """Update position, velocity and acceleration of controller."""
@@ -91,52 +124,60 @@ class Controller:
                 self.velocity = positions_diff / timestamps_diff
             LOG.debug('Velocity for %s: %s', self.name, self.velocity)
 
-    def add_controller_position(self, image: np.ndarray) -> np.ndarray:
-        """Draw controller position to image."""
-        image = cv2.circle(image, self.position, 10, (255, 0, 0), -1)
+    def add_controller_position(self, image: np.ndarray,
+                                position: Tuple[int, int] = None) -> np.ndarray:
+        """Draw controller position (the last known one if not passed) to image."""
+        image = cv2.circle(image, position or self.position, 10, (255, 0, 0), -1)
         return image
 
-    def calibrate(self, controller_settings: Dict[str, Any]):
+    def calibrate(self, controller_settings: Dict[str, Any],
+                  stream_source: int = InputVideoStream.STREAM_SOURCE,
+                  yuv_capture: bool = False):
         """Calibrate controller colors and volume.
 
         Update them in the ``self`` and in the ``controller_settings``.
+        With ``yuv_capture``, the YCrCb colors are calibrated instead of HSV.
         """
-        calibrator = Calibrator(self, controller_settings)
+        calibrator = Calibrator(self, controller_settings, stream_source, yuv_capture)
         calibrator.calibrate_color()
         calibrator.calibrate_volume()
 
     @staticmethod
     def get_largest_contour_center(mask: np.ndarray) -> Tuple[float, float]:
         """Return center of largest contour in mask."""
-        # Find contours in the mask
-        contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contours = contours[-2]
-
-        # Get the center of the largest contour
-        if contours:
-            centroid = max(contours, key=cv2.contourArea)
-            centroid_moments = cv2.moments(centroid)
-            controller_position = (
-                int(centroid_moments["m10"] / centroid_moments["m00"]),
-                int(centroid_moments["m01"] / centroid_moments["m00"])
-            )
-        else:
-            controller_position = None
+        return ContoursBlobDetector().get_center(mask)
+
+    def get_blob_center(self, mask: np.ndarray, scale: float = 1) -> Tuple[float, float]:
+        """Return center of controller's blob in mask by the controller's blob detector.
+
+        The ``scale`` is the scale of the mask relative to the controller's position.
+        """
+        previous_position = None
+        if self.position is not None:
+            previous_position = (int(self.position[0] * scale), int(self.position[1] * scale))
+        return self.blob_detector.get_center(mask, previous_position, scale)
 
-        return controller_position
+    def get_controller_mask(self, frame: Frame, blur: bool = True) -> np.ndarray:
+        """Get mask with controller area based on controller's color range.
 
-    def get_controller_mask(self, frame: Frame) -> np.ndarray:
-        """Get mask with controller area based on controller's color range."""
+        Blurring can be skipped to save time when the tracker falls behind.
+        """
         frame = copy.deepcopy(frame)
 
         # Blur image to reduce noise
-        frame.image = cv2.GaussianBlur(frame.image, (11, 11), 0)
+        if blur:
+            frame.image = cv2.GaussianBlur(frame.image, (11, 11), 0)
 
-        # Convert frame to HSV color space
-        image_hsv = cv2.cvtColor(frame.image, cv2.COLOR_BGR2HSV)
+        if frame.color_space == Frame.YCRCB_COLOR_SPACE:
+            # Segment directly in the color space of the camera, no conversion is needed
+            mask = cv2.inRange(frame.image, self.color_range.ycrcb_low,
+                               self.color_range.ycrcb_high)
+        else:
+            # Convert frame to HSV color space
+            image_hsv = cv2.cvtColor(frame.image, cv2.COLOR_BGR2HSV)
 
-        # Create a mask for the controller color
-        mask = cv2.inRange(image_hsv, self.color_low, self.color_high)
+            # Create a mask for the controller color
+            mask = cv2.inRange(image_hsv, self.color_range.hsv_low, self.color_range.hsv_high)
 
         # Remove small areas and smooth big areas
         mask = cv2.erode(mask, None, iterations=2)
@@ -151,20 +192,28 @@ class Calibrator:
     HSV_AVERAGE_SPAN_LOW = HSV(8, 10, 10)
     HSV_AVERAGE_SPAN_HIGH = HSV(8, 100, 100)
     HSV_ITERATOR_STEP = HSV(10, 40, 40)
+    #: Span around the average color in YCrCb. Luma changes with lighting, so its span is wide.
+    YCRCB_AVERAGE_SPAN = YCrCb(80, 12, 12)
     CALIBRATING_CIRCLE_RADIUS = 20
     VELOCITY_VOLUME_FACTOR = 10
 
-    def __init__(self, controller: Controller, controller_settings: Dict[str, Any]):
+    def __init__(self, controller: Controller, controller_settings: Dict[str, Any],
+                 stream_source: int = InputVideoStream.STREAM_SOURCE,
+                 yuv_capture: bool = False):
         #: Input stream for calibration
-        self.stream = InputVideoStream()
+        self.stream = InputVideoStream(stream_source=stream_source, yuv_capture=yuv_capture)
+        #: If the YCrCb colors are calibrated instead of HSV
+        self.yuv_capture = yuv_capture
         #: Calibrated controller
         self.controller = controller
         #: Calibrated controller's settings
         self.controller_settings = controller_settings
         #: Low color bound for controller detection during calibration
-        self.color_low = controller.color_low
+        self.color_low = (controller.color_range.ycrcb_low if yuv_capture
+                          else controller.color_range.hsv_low)
         #: High color bound for controller detection during calibration
-        self.color_high = controller.color_high
+        self.color_high = (controller.color_range.ycrcb_high if yuv_capture
+                           else controller.color_range.hsv_high)
         #: Radius of circle for calibrating
         self.calibrating_circle_radius = Calibrator.CALIBRATING_CIRCLE_RADIUS
         #: Centers of circles for calibrating
@@ -203,6 +252,12 @@ class Calibrator:
 
         return colorspace_iterator
 
+    @staticmethod
+    def get_ycrcb_range(average_color: YCrCb) -> Tuple[YCrCb, YCrCb]:
+        """Return low and high YCrCb color bounds around the average color."""
+        return (average_color - Calibrator.YCRCB_AVERAGE_SPAN,
+                average_color + Calibrator.YCRCB_AVERAGE_SPAN)
+
     def calibrate_volume(self):
         """Calibrate controllers's speed that will play standard volume."""
         velocity = int(self.stream.image_size.height * Calibrator.VELOCITY_VOLUME_FACTOR)
@@ -222,7 +277,7 @@ class Calibrator:
             self.next_calibrating_point = False
             while not (self.next_calibrating_point or self.stop_calibrating):
                 frame = self.stream.read_frame()
-                image = copy.deepcopy(frame.image)
+                image = copy.deepcopy(frame.get_bgr_image())
                 image_text = (
                     f'Calibrate {self.controller.name}. '
                     'Keys: s/l=smaller/larger, r=reset, c=calibrate, n=next point, q=quit.'
@@ -243,8 +298,13 @@ class Calibrator:
         pressed_key = cv2.waitKey(1)
 
         if pressed_key == ord('n'):
-            self.controller_settings['color_low'] = HSV.to_save_format(self.controller.color_low)
-            self.controller_settings['color_high'] = HSV.to_save_format(self.controller.color_high)
+            color_range = self.controller.color_range
+            if self.yuv_capture:
+                self.controller_settings['ycrcb_low'] = color_range.ycrcb_low.to_save_format()
+                self.controller_settings['ycrcb_high'] = color_range.ycrcb_high.to_save_format()
+            else:
+                self.controller_settings['color_low'] = color_range.hsv_low.to_save_format()
+                self.controller_settings['color_high'] = color_range.hsv_high.to_save_format()
             self.next_calibrating_point = True
 
         if pressed_key == ord('s'):
@@ -254,8 +314,13 @@ class Calibrator:
             self.stop_calibrating = True
 
         if pressed_key == ord('r'):
-            self.controller.color_low = HSV(*HSV.MAXIMUM)
-            self.controller.color_high = HSV(*HSV.MINIMUM)
+            empty_range = ColorRange()
+            if self.yuv_capture:
+                self.controller.color_range = self.controller.color_range._replace(
+                    ycrcb_low=empty_range.ycrcb_low, ycrcb_high=empty_range.ycrcb_high)
+            else:
+                self.controller.color_range = self.controller.color_range._replace(
+                    hsv_low=empty_range.hsv_low, hsv_high=empty_range.hsv_high)
 
         if pressed_key == ord('l'):
             self.calibrating_circle_radius += 10
@@ -264,11 +329,22 @@ class Calibrator:
             mask = np.zeros(frame.image.shape[:2], dtype=np.uint8)
             mask = cv2.circle(mask, circle_center,
                               self.calibrating_circle_radius, (255, 0, 0), -1)
-            image_hsv = cv2.cvtColor(frame.image, cv2.COLOR_BGR2HSV)
-            average_color = HSV(*cv2.mean(image_hsv, mask)[:3])
-
-            self.color_low = average_color - self.HSV_AVERAGE_SPAN_LOW
-            self.color_high = average_color + self.HSV_AVERAGE_SPAN_HIGH
-            self.controller.color_low = HSV.minimum(self.controller.color_low, self.color_low)
-            self.controller.color_high = HSV.maximum(self.controller.color_high, self.color_high)
+            if self.yuv_capture:
+                # The frame is already in YCrCb
+                average_color = YCrCb(*cv2.mean(frame.image, mask)[:3])
+                self.color_low, self.color_high = self.get_ycrcb_range(average_color)
+                color_range = self.controller.color_range
+                self.controller.color_range = color_range._replace(
+                    ycrcb_low=YCrCb.minimum(color_range.ycrcb_low, self.color_low),
+                    ycrcb_high=YCrCb.maximum(color_range.ycrcb_high, self.color_high))
+            else:
+                image_hsv = cv2.cvtColor(frame.image, cv2.COLOR_BGR2HSV)
+                average_color = HSV(*cv2.mean(image_hsv, mask)[:3])
+
+                self.color_low = average_color - self.HSV_AVERAGE_SPAN_LOW
+                self.color_high = average_color + self.HSV_AVERAGE_SPAN_HIGH
+                color_range = self.controller.color_range
+                self.controller.color_range = color_range._replace(
+                    hsv_low=HSV.minimum(color_range.hsv_low, self.color_low),
+                    hsv_high=HSV.maximum(color_range.hsv_high, self.color_high))
             LOG.debug('Controllers colors: %s - %s.', self.color_low, self.color_high)
@@ -1,38 +1,123 @@
 """Module with drum set."""
 
+from threading import Lock
+import time
+from typing import Any, Iterable, List, Tuple
+
 import drums.settings
-from drums.controllers import Controller, HSV
+from drums.blob_detection import BlobDetector, create_blob_detector
+from drums.controllers import ColorRange, Controller, HSV, YCrCb
 from drums.percussion import Percussion
+from drums.streaming import InputVideoStream
 
 
 class DrumSet:
     """Air drums."""
 
-    def __init__(self, settings: drums.settings.Settings):
+    #: Key of the capture source used if there are no sources in the settings
+    DEFAULT_SOURCE = 'default'
+
+    def __init__(self, settings: drums.settings.Settings, audio_sink: Any = None):
         self.settings = settings
+        #: Settings of capture sources. The first one is the primary (displayed) source.
+        self.sources = (self.settings.settings.get('sources')
+                        or {DrumSet.DEFAULT_SOURCE: {
+                            'stream_source': InputVideoStream.STREAM_SOURCE}})
+        #: Key of the primary capture source
+        self.primary_source = next(iter(self.sources))
         self.percussion = [Percussion(percussion['name'],
                                       percussion['sound_path'],
                                       tuple(percussion['center_position']),
-                                      percussion['radius'])
+                                      percussion['radius'],
+                                      percussion.get('source', self.primary_source),
+                                      self.settings.samples.get(percussion['sound_path']))
                            for percussion in self.settings.settings['percussion'].values()]
+        for percussion in self.percussion:
+            percussion.audio_sink = audio_sink
         self.controllers = [Controller(key,
                                        setting['name'],
-                                       HSV(*setting['color_low']),
-                                       HSV(*setting['color_high']),
-                                       setting['velocity_max_volume'])
+                                       ColorRange(
+                                           HSV(*setting['color_low']),
+                                           HSV(*setting['color_high']),
+                                           YCrCb(*setting.get('ycrcb_low', YCrCb.MAXIMUM)),
+                                           YCrCb(*setting.get('ycrcb_high', YCrCb.MINIMUM))),
+                                       setting['velocity_max_volume'],
+                                       setting.get('source', self.primary_source),
+                                       create_blob_detector(
+                                           setting.get('blob_detection', 'contours'),
+                                           setting.get('min_blob_area', BlobDetector.MIN_AREA)))
                             for key, setting in self.settings.settings['controllers'].items()]
+        #: Publisher of hit and position events (events are not published if not set)
+        self.event_publisher = None
+        # Controllers from several sources can be played from several threads
+        self._play_lock = Lock()
+        self._check_sources()
 
-    def play(self):
-        """Play drum set."""
-        for controller in self.controllers:
-            for percussion in self.percussion:
-                if percussion.is_played(controller):
-                    percussion.play(controller)
+    def _check_sources(self):
+        """Check that controllers and percussion are assigned to existing capture sources."""
+        items = ([('Controller', controller.key, controller.source)
+                  for controller in self.controllers]
+                 + [('Percussion', percussion.name, percussion.source)
+                    for percussion in self.percussion])
+        for item_type, item_name, source in items:
+            if source not in self.sources:
+                raise ValueError(f'{item_type} {item_name!r} has unknown source {source!r}, '
+                                 f'use one of {", ".join(self.sources)}.')
+
+    @staticmethod
+    def get_source_items(items: Iterable[Any], source: str) -> List[Any]:
+        """Return controllers or percussion assigned to the capture source."""
+        return [item for item in items if item.source == source]
+
+    def play(self, controllers: Iterable[Controller] = None) -> List[Tuple[str, str]]:
+        """Play drum set and return hits as pairs of controller key and percussion name.
+
+        Only ``controllers`` are checked if passed (even if empty), otherwise all controllers.
+        Controllers can play only percussion from the same capture source.
+        """
+        hits = []
+        with self._play_lock:
+            if controllers is None:
+                controllers = self.controllers
+            for controller in controllers:
+                for percussion in self.percussion:
+                    if percussion.source != controller.source:
+                        continue
+                    if percussion.is_played(controller):
+                        percussion.play(controller)
+                        hits.append((controller.key, percussion.name))
+                        if self.event_publisher is not None:
+                            self.event_publisher.publish_hit(
+                                self._get_timestamp(controller), controller.key,
+                                percussion.name, percussion.get_volume(controller))
+            if self.event_publisher is not None:
+                self._publish_positions(controllers)
+        return hits
+
+    def _publish_positions(self, controllers: Iterable[Controller]):
+        """Publish the last tracked positions of controllers."""
+        positions = [(controller.key, controller.positions_in_time[-1].position)
+                     for controller in controllers if controller.positions_in_time]
+        if positions:
+            self.event_publisher.publish_positions(
+                max(self._get_timestamp(controller) for controller in controllers),
+                positions)
+
+    @staticmethod
+    def _get_timestamp(controller: Controller) -> float:
+        """Return timestamp of the frame in which the controller was tracked last."""
+        if controller.positions_in_time:
+            return controller.positions_in_time[-1].timestamp
+        return time.time()
+
+    def setup_drum_set(self, save: bool = True, yuv_capture: bool = False):
+        """Set up drum set: calibrate controllers and save to settings file.
 
-    def setup_drum_set(self, save: bool = True):
-        """Set up drum set: calibrate controllers and save to settings file."""
+        With ``yuv_capture``, the colors are calibrated in YCrCb for the raw YUV tracking.
+        """
         for controller in self.controllers:
             controller_settings = self.settings.settings['controllers'][controller.key]
-            controller.calibrate(controller_settings)
+            controller.calibrate(controller_settings,
+                                 self.sources[controller.source]['stream_source'], yuv_capture)
             if save:
                 self.settings.save_settings()
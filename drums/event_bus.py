@@ -0,0 +1,233 @@
+"""Local publish/subscribe bus with hit and controller position events.
+
+Events are sent as compact binary datagrams over a Unix domain socket.
+Every datagram starts with one byte of the event type:
+
+* description (``'<B'`` + UTF-8 JSON with controller keys and percussion names),
+  sent to each new subscriber, so it can translate indexes in other events to names,
+* hit (``'<BdBBf'``: type, timestamp, controller index, percussion index, volume),
+* positions (``'<BdB'``: type, timestamp, count + count times ``'<Bhh'``:
+  controller index, x, y), sent after each tracked frame.
+"""
+
+from collections import namedtuple
+import json
+import logging
+import math
+import os
+import socket
+import stat
+import struct
+import tempfile
+import time
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+
+LOG = logging.getLogger(__name__)
+
+
+#: Default path of the publisher socket
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'air_drums_events.sock')
+
+DESCRIPTION_EVENT = 0
+HIT_EVENT = 1
+POSITIONS_EVENT = 2
+#: Messages of subscribers to the publisher
+SUBSCRIBE_MESSAGE = b'subscribe'
+UNSUBSCRIBE_MESSAGE = b'unsubscribe'
+
+_HEADER = struct.Struct('<B')
+_HIT = struct.Struct('<BdBBf')
+_POSITIONS_HEADER = struct.Struct('<BdB')
+_POSITION = struct.Struct('<Bhh')
+#: Coordinate used for unknown controller positions
+_UNKNOWN_COORDINATE = -32768
+
+DescriptionEvent = namedtuple('DescriptionEvent', 'controller_keys percussion_names')
+HitEvent = namedtuple('HitEvent', 'timestamp controller_index percussion_index volume')
+PositionsEvent = namedtuple('PositionsEvent', 'timestamp positions')
+Event = Union[DescriptionEvent, HitEvent, PositionsEvent]
+
+
+def encode_description(controller_keys: Sequence[str], percussion_names: Sequence[str]) -> bytes:
+    """Return encoded description event."""
+    description = {'controller_keys': list(controller_keys),
+                   'percussion_names': list(percussion_names)}
+    return _HEADER.pack(DESCRIPTION_EVENT) + json.dumps(description).encode('utf-8')
+
+
+def encode_hit(timestamp: float, controller_index: int, percussion_index: int,
+               volume: Optional[float]) -> bytes:
+    """Return encoded hit event. Unknown volume is encoded as NaN."""
+    return _HIT.pack(HIT_EVENT, timestamp, controller_index, percussion_index,
+                     math.nan if volume is None else volume)
+
+
+def encode_positions(timestamp: float,
+                     positions: Sequence[Tuple[int, Optional[Tuple[int, int]]]]) -> bytes:
+    """Return encoded positions event from controller indexes and their positions."""
+    return _POSITIONS_HEADER.pack(POSITIONS_EVENT, timestamp, len(positions)) + b''.join(
+        _POSITION.pack(index, *(position or (_UNKNOWN_COORDINATE, _UNKNOWN_COORDINATE)))
+        for index, position in positions)
+
+
+def decode_event(message: bytes) -> Event:
+    """Return event decoded from datagram."""
+    event_type, = _HEADER.unpack_from(message)
+    if event_type == DESCRIPTION_EVENT:
+        description = json.loads(message[_HEADER.size:].decode('utf-8'))
+        return DescriptionEvent(description['controller_keys'], description['percussion_names'])
+    if event_type == HIT_EVENT:
+        _, timestamp, controller_index, percussion_index, volume = _HIT.unpack(message)
+        return HitEvent(timestamp, controller_index, percussion_index,
+                        None if math.isnan(volume) else volume)
+    if event_type == POSITIONS_EVENT:
+        _, timestamp, count = _POSITIONS_HEADER.unpack_from(message)
+        positions = []
+        for index, x_position, y_position in _POSITION.iter_unpack(
+                message[_POSITIONS_HEADER.size:_POSITIONS_HEADER.size + count * _POSITION.size]):
+            position = (None if x_position == _UNKNOWN_COORDINATE
+                        else (x_position, y_position))
+            positions.append((index, position))
+        return PositionsEvent(timestamp, positions)
+    raise ValueError(f'Unknown event type {event_type}.')
+
+
+def remove_socket(socket_path: str):
+    """Remove socket (e.g. left by the previous run) if it exists.
+
+    Raise ``FileExistsError`` if the path exists, but it is not a socket,
+    so a mistyped path never deletes a regular file.
+    """
+    try:
+        path_mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(path_mode):
+        raise FileExistsError(f'{socket_path} exists and it is not a socket.')
+    os.remove(socket_path)
+
+
+class EventPublisher:
+    """Publisher of hit and controller position events to local subscribers.
+
+    Subscribers register by sending ``SUBSCRIBE_MESSAGE`` from their own bound socket.
+    Sending never blocks: if the socket buffer of a subscriber is full, the event
+    is dropped for that subscriber, and subscribers that disappeared are removed.
+    """
+
+    #: Maximal number of subscribers
+    MAX_SUBSCRIBERS = 16
+
+    def __init__(self, controller_keys: Sequence[str], percussion_names: Sequence[str],
+                 socket_path: str = SOCKET_PATH):
+        #: Path of the publisher socket
+        self.socket_path = socket_path
+        #: Addresses of subscribers
+        self.subscribers = set()
+        #: Number of events dropped because of slow subscribers
+        self.dropped_events_count = 0
+        self._controller_indexes = {key: index for index, key in enumerate(controller_keys)}
+        self._percussion_indexes = {name: index for index, name in enumerate(percussion_names)}
+        self._description = encode_description(controller_keys, percussion_names)
+
+        remove_socket(socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(socket_path)
+        self._socket.setblocking(False)
+        LOG.debug('Publishing events to %s.', socket_path)
+
+    def publish_hit(self, timestamp: float, controller_key: str, percussion_name: str,
+                    volume: Optional[float]):
+        """Publish hit of percussion by controller."""
+        self._send(encode_hit(timestamp, self._controller_indexes[controller_key],
+                              self._percussion_indexes[percussion_name], volume))
+
+    def publish_positions(self, timestamp: float,
+                          positions: Iterable[Tuple[str, Optional[Tuple[int, int]]]]):
+        """Publish positions of controllers (by their keys) tracked in one frame."""
+        self._send(encode_positions(timestamp, [(self._controller_indexes[key], position)
+                                                for key, position in positions]))
+
+    def close(self):
+        """Close the publisher socket."""
+        self._socket.close()
+        remove_socket(self.socket_path)
+
+    def _accept_subscribers(self):
+        """Handle pending subscribe and unsubscribe messages."""
+        while True:
+            try:
+                message, address = self._socket.recvfrom(64)
+            except (BlockingIOError, InterruptedError):
+                return
+            if not address:
+                continue
+            if message == SUBSCRIBE_MESSAGE:
+                if (address not in self.subscribers
+                        and len(self.subscribers) < EventPublisher.MAX_SUBSCRIBERS):
+                    LOG.debug('New subscriber %s.', address)
+                    self.subscribers.add(address)
+                    self._send_to(self._description, address)
+            elif message == UNSUBSCRIBE_MESSAGE:
+                self.subscribers.discard(address)
+
+    def _send(self, message: bytes):
+        self._accept_subscribers()
+        for address in list(self.subscribers):
+            self._send_to(message, address)
+
+    def _send_to(self, message: bytes, address: str):
+        try:
+            self._socket.sendto(message, address)
+        except (BlockingIOError, InterruptedError):
+            # Never wait for a slow subscriber
+            self.dropped_events_count += 1
+        except OSError:
+            LOG.debug('Subscriber %s disappeared.', address)
+            self.subscribers.discard(address)
+
+
+class EventSubscriber:
+    """Stub subscriber of the events for testing and benchmarking."""
+
+    #: Interval of repeating subscription, so the subscriber survives publisher restarts [s]
+    SUBSCRIBE_INTERVAL = 1
+
+    def __init__(self, socket_path: str = SOCKET_PATH):
+        #: Path of the publisher socket
+        self.publisher_socket_path = socket_path
+        #: Path of the subscriber socket
+        self.socket_path = os.path.join(tempfile.gettempdir(),
+                                        f'air_drums_subscriber_{os.getpid()}.sock')
+        remove_socket(self.socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.socket_path)
+        self._socket.settimeout(EventSubscriber.SUBSCRIBE_INTERVAL)
+
+    def subscribe(self):
+        """Send subscription to the publisher if it is running."""
+        try:
+            self._socket.sendto(SUBSCRIBE_MESSAGE, self.publisher_socket_path)
+        except OSError:
+            LOG.debug('Publisher %s is not running.', self.publisher_socket_path)
+
+    def receive_events(self) -> Iterator[Tuple[Event, float]]:
+        """Yield received events with their receive time."""
+        self.subscribe()
+        while True:
+            try:
+                message = self._socket.recv(65536)
+            except socket.timeout:
+                self.subscribe()
+                continue
+            yield decode_event(message), time.time()
+
+    def close(self):
+        """Unsubscribe and close the subscriber socket."""
+        try:
+            self._socket.sendto(UNSUBSCRIBE_MESSAGE, self.publisher_socket_path)
+        except OSError:
+            pass
+        self._socket.close()
+        remove_socket(self.socket_path)
@@ -2,16 +2,24 @@
 
 import time
 
+import cv2
 import numpy as np
 
 
 class Frame:
     """Data container representing captured frame."""
 
-    __slots__ = ('grabbed', 'image', 'fps', 'frame_count', 'timestamp')
+    #: Color space of images decoded by OpenCV
+    BGR_COLOR_SPACE = 'bgr'
+    #: Color space of images captured as raw YUV (with chroma channels in Cr, Cb order)
+    YCRCB_COLOR_SPACE = 'ycrcb'
+
+    __slots__ = ('grabbed', 'image', 'fps', 'frame_count', 'timestamp', 'tracking_result',
+                 'color_space')
 
     def __init__(self, grabbed: bool, image: np.ndarray, fps: float = None,
-                 frame_count: int = None, timestamp: float = None):
+                 frame_count: int = None, timestamp: float = None,
+                 color_space: str = BGR_COLOR_SPACE):
         #: If the frame was grabbed correctly.
         self.grabbed = grabbed
         #: Grabbed image.
@@ -22,3 +30,14 @@ class Frame:
         self.frame_count = frame_count
         #: Timestamp of the frame.
         self.timestamp = timestamp or time.time()
+        #: Immutable ``TrackingResult`` of tracking controllers in the frame
+        #: (None if not tracked yet), set by the tracker.
+        self.tracking_result = None
+        #: Color space of the image.
+        self.color_space = color_space
+
+    def get_bgr_image(self) -> np.ndarray:
+        """Return image converted to BGR (e.g. for displaying)."""
+        if self.color_space == Frame.YCRCB_COLOR_SPACE:
+            return cv2.cvtColor(self.image, cv2.COLOR_YCrCb2BGR)
+        return self.image
@@ -1,19 +1,37 @@
 """Module managing the whole air drums process."""
 
-from collections import deque
+from collections import deque, namedtuple
 import logging
 from threading import Thread
 import sys
+from typing import Callable, Deque
 
 import drums.settings
 from drums.drum_set import DrumSet
+from drums.event_bus import EventPublisher
+from drums.frame import Frame
+from drums.motion_gate import MotionGate
 from drums.streaming import InputVideoStream, OutputVideoStream
-from drums.tracker import Tracker
+from drums.tracker import Tracker, TrackerOptions, TimestampMerger
 
 
 LOG = logging.getLogger(__name__)
 
 
+#: Options of the air drums pipeline:
+#: ``decoupled_capture`` (decode only frames that will be tracked),
+#: ``profiler`` (``ThreadProfiler`` of the pipeline threads, disabled if not set),
+#: ``motion_gate`` (segment only moving regions),
+#: ``event_socket_path`` (socket publishing hit and position events, disabled if not set),
+#: ``tracker_workers_count`` (number of tracker threads of each capture source) and
+#: ``yuv_capture`` (capture raw YUV frames and track them without decoding to BGR)
+InterfaceOptions = namedtuple(
+    'InterfaceOptions',
+    'decoupled_capture profiler motion_gate event_socket_path tracker_workers_count '
+    'yuv_capture',
+    defaults=(False, None, False, None, 1, False))
+
+
 class Interface:
     """Interface that is handling the whole air drums app."""
 
@@ -21,30 +39,108 @@ class Interface:
     DEQUE_MAX_LENGTH = 50
     #: Small thread switch interval to prevent lags in processing.
     THREAD_SWITCH_INTERVAL = 0.0001
+    #: Timeout for joining the pipeline threads after quitting [s]
+    THREAD_JOIN_TIMEOUT = 1
 
     def __init__(self, settings: drums.settings.Settings,
-                 deque_max_length: int = DEQUE_MAX_LENGTH):
-        self.frames_to_track = deque(maxlen=deque_max_length)
+                 deque_max_length: int = DEQUE_MAX_LENGTH,
+                 options: InterfaceOptions = InterfaceOptions()):
+        #: Options of the pipeline
+        self.options = options
+        self.deque_max_length = deque_max_length
+        # Queues of the primary (displayed) capture source
+        self.frames_to_track = self._create_frames_to_track()
         self.frames_tracked = deque(maxlen=deque_max_length)
         self.settings = settings
         self.drum_set = DrumSet(self.settings)
+        # Started pipeline threads and functions stopping them
+        self._threads = []
+        self._stop_functions = []
         sys.setswitchinterval(Interface.THREAD_SWITCH_INTERVAL)
 
     def start_interface(self):
-        """Calibrate controllers, run input stream, tracking and output video stream."""
+        """Calibrate controllers, run input streams, tracking and output video stream.
+
+        Each capture source has its own input stream and tracker threads. OpenCV releases
+        the GIL during decoding and segmentation, so the sources and the tracker workers
+        run in parallel.
+        With several sources, positions are merged in time order by ``TimestampMerger``.
+        """
         LOG.debug('Starting interface.')
 
-        self.drum_set.setup_drum_set()
+        self.drum_set.setup_drum_set(yuv_capture=self.options.yuv_capture)
+
+        if self.options.event_socket_path:
+            self.drum_set.event_publisher = EventPublisher(
+                [controller.key for controller in self.drum_set.controllers],
+                [percussion.name for percussion in self.drum_set.percussion],
+                self.options.event_socket_path)
+
+        merger = None
+        if len(self.drum_set.sources) > 1:
+            merger = TimestampMerger(self.drum_set, self.drum_set.sources)
+            self._start_thread('merger', merger.start_merger, merger.stop_merger)
+
+        for source, source_settings in self.drum_set.sources.items():
+            self._start_source(source, source_settings['stream_source'], merger)
+
+        output_video_stream = OutputVideoStream(drum_set=self.drum_set, frames=self.frames_tracked,
+                                                source=self.drum_set.primary_source)
+        if self.options.profiler is None:
+            output_video_stream.start_stream()
+        else:
+            self.options.profiler.profile(output_video_stream.start_stream)()
+
+        self._stop_threads()
+        if self.drum_set.event_publisher is not None:
+            self.drum_set.event_publisher.close()
+        if self.options.profiler is not None:
+            self.options.profiler.write_stats()
+            self.options.profiler.print_summary()
+
+    def _start_source(self, source: str, stream_source: int, merger: TimestampMerger = None):
+        """Start input stream and tracker threads of the capture source."""
+        LOG.debug('Starting capture source %s (stream source %s).', source, stream_source)
+        if source == self.drum_set.primary_source:
+            frames_to_track, frames_tracked = self.frames_to_track, self.frames_tracked
+            thread_names = ['input_stream', 'tracker']
+        else:
+            # Frames of other sources are not displayed, keep only the last one
+            frames_to_track, frames_tracked = self._create_frames_to_track(), deque(maxlen=1)
+            thread_names = [f'input_stream_{source}', f'tracker_{source}']
+
+        input_video_stream = InputVideoStream(frames=frames_to_track, stream_source=stream_source,
+                                              decoupled_capture=self.options.decoupled_capture,
+                                              yuv_capture=self.options.yuv_capture)
+        motion_gate = MotionGate() if self.options.motion_gate else None
+        tracker = Tracker(frames_to_track, frames_tracked, self.drum_set, source,
+                          TrackerOptions(merger=merger, motion_gate=motion_gate,
+                                         workers_count=self.options.tracker_workers_count))
+
+        self._start_thread(thread_names[0], input_video_stream.start_stream,
+                           input_video_stream.stop_stream)
+        self._start_thread(thread_names[1], tracker.start_tracker, tracker.stop_tracker)
+        for worker_index in range(1, self.options.tracker_workers_count):
+            self._start_thread(f'{thread_names[1]}_worker_{worker_index}',
+                               tracker.start_tracker, tracker.stop_tracker)
 
-        input_video_stream = InputVideoStream(frames=self.frames_to_track)
-        tracker = Tracker(self.frames_to_track, self.frames_tracked, self.drum_set)
-        output_video_stream = OutputVideoStream(drum_set=self.drum_set, frames=self.frames_tracked)
+    def _start_thread(self, name: str, target: Callable[[], None], stop: Callable[[], None]):
+        """Start daemon thread, profile it in profiling mode."""
+        if self.options.profiler is not None:
+            target = self.options.profiler.profile(target)
+        thread = Thread(name=name, target=target)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+        self._stop_functions.append(stop)
 
-        input_thread = Thread(name='input_stream', target=input_video_stream.start_stream)
-        tracker_thread = Thread(name='tracker', target=tracker.start_tracker)
+    def _stop_threads(self):
+        """Stop the pipeline threads and wait for them, so they can finish profiling."""
+        for stop in self._stop_functions:
+            stop()
+        for thread in self._threads:
+            thread.join(Interface.THREAD_JOIN_TIMEOUT)
 
-        input_thread.daemon = True
-        tracker_thread.daemon = True
-        input_thread.start()
-        tracker_thread.start()
-        output_video_stream.start_stream()
+    def _create_frames_to_track(self) -> Deque[Frame]:
+        # In the decoupled capture mode, the queue is a slot with the latest frame only
+        return deque(maxlen=1 if self.options.decoupled_capture else self.deque_max_length)
@@ -0,0 +1,99 @@
+"""Adaptive load shedding of controllers tracking."""
+
+from collections import namedtuple, Counter
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+QualityLevel = namedtuple('QualityLevel', 'name blur tracking_scale newest_frame_only')
+
+
+class LoadShedder:
+    """Adaptive controller of the tracking quality.
+
+    Watches the depth of the queue with frames to track and the time of tracking
+    one frame. When the tracker falls behind the input stream, the quality is stepped
+    down, so the latency stays bounded. When there is a headroom again,
+    the quality is stepped back up.
+    """
+
+    #: Quality levels ordered from the best to the cheapest one
+    QUALITY_LEVELS = (
+        QualityLevel('full', blur=True, tracking_scale=1.0, newest_frame_only=False),
+        QualityLevel('no_blur', blur=False, tracking_scale=1.0, newest_frame_only=False),
+        QualityLevel('half_resolution', blur=False, tracking_scale=0.5,
+                     newest_frame_only=False),
+        QualityLevel('newest_frame_only', blur=False, tracking_scale=0.5,
+                     newest_frame_only=True),
+    )
+    #: Time available for tracking one frame (input stream runs at 30 FPS) [s]
+    FRAME_TIME_BUDGET = 1 / 30
+    #: Queue depth above which the quality is stepped down
+    QUEUE_DEPTH_HIGH = 3
+    #: Queue depth up to which the quality can be stepped up
+    QUEUE_DEPTH_LOW = 1
+    #: Fraction of the frame time budget that has to be free to step the quality up
+    HEADROOM = 0.3
+    #: Smoothing factor of the exponential moving average of tracking time
+    TRACKING_TIME_SMOOTHING = 0.2
+    #: Number of tracked frames after a transition before the quality can be stepped down
+    STEP_DOWN_COOLDOWN = 5
+    #: Number of tracked frames after a transition before the quality can be stepped up
+    STEP_UP_COOLDOWN = 60
+
+    def __init__(self, frame_time_budget: float = FRAME_TIME_BUDGET):
+        #: Time available for tracking one frame [s]
+        self.frame_time_budget = frame_time_budget
+        #: Index of the current quality level in ``QUALITY_LEVELS``
+        self.level_index = 0
+        #: Smoothed time of tracking one frame [s]
+        self.tracking_time = None
+        #: Number of tracked frames since the last transition
+        self.frames_since_transition = 0
+        #: Counts of transitions between quality levels, keyed by ``(from, to)`` names
+        self.transitions = Counter()
+        #: Number of frames skipped by the tracker without tracking at the cheapest level
+        self.frames_dropped = 0
+
+    @property
+    def quality(self) -> QualityLevel:
+        """Return current quality level."""
+        return LoadShedder.QUALITY_LEVELS[self.level_index]
+
+    def update(self, queue_depth: int, tracking_time: float):
+        """Update the quality level based on queue depth and time of tracking the last frame."""
+        if self.tracking_time is None:
+            self.tracking_time = tracking_time
+        else:
+            self.tracking_time += (LoadShedder.TRACKING_TIME_SMOOTHING
+                                   * (tracking_time - self.tracking_time))
+        self.frames_since_transition += 1
+
+        if self._is_overloaded(queue_depth):
+            if (self.frames_since_transition >= LoadShedder.STEP_DOWN_COOLDOWN
+                    and self.level_index < len(LoadShedder.QUALITY_LEVELS) - 1):
+                self._change_level(self.level_index + 1, queue_depth)
+        elif self._has_headroom(queue_depth):
+            if (self.frames_since_transition >= LoadShedder.STEP_UP_COOLDOWN
+                    and self.level_index > 0):
+                self._change_level(self.level_index - 1, queue_depth)
+
+    def _is_overloaded(self, queue_depth: int) -> bool:
+        return (queue_depth > LoadShedder.QUEUE_DEPTH_HIGH
+                or self.tracking_time > self.frame_time_budget)
+
+    def _has_headroom(self, queue_depth: int) -> bool:
+        return (queue_depth <= LoadShedder.QUEUE_DEPTH_LOW
+                and self.tracking_time < (1 - LoadShedder.HEADROOM) * self.frame_time_budget)
+
+    def _change_level(self, level_index: int, queue_depth: int):
+        previous_quality = self.quality
+        self.level_index = level_index
+        self.frames_since_transition = 0
+        self.transitions[(previous_quality.name, self.quality.name)] += 1
+        LOG.info('Tracking quality changed from %s to %s '
+                 '(queue depth: %s, tracking time: %.1f ms, transitions: %s).',
+                 previous_quality.name, self.quality.name, queue_depth,
+                 self.tracking_time * 1000, sum(self.transitions.values()))
@@ -0,0 +1,156 @@
+"""Motion gating of controllers tracking."""
+
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from drums.controllers import Controller
+from drums.frame import Frame
+
+
+LOG = logging.getLogger(__name__)
+
+
+#: Rectangular region of image (x, y, width, height)
+Region = Tuple[int, int, int, int]
+
+
+class MotionGate:
+    """Gate restricting color segmentation to image regions that can contain controllers.
+
+    The regions are bounding boxes of areas changed since the previous frame
+    (found in a downscaled gray image) and windows around the last known controllers
+    positions. Most of the image is static background between strokes,
+    so the segmentation runs only on a small part of the image.
+    """
+
+    #: Scale of the image for computing difference between frames
+    DIFFERENCE_SCALE = 1 / 8
+    #: Minimal change of gray level to consider the pixel changed
+    DIFFERENCE_THRESHOLD = 15
+    #: Margin added around the regions, so blurring and erosion are not affected by edges
+    #: (in pixels of the full resolution image) [px]
+    REGION_MARGIN = 16
+    #: Minimal margin after scaling. The blurring, erosion and dilation kernels
+    #: are not scaled, together they reach 9 px from the region edge [px]
+    MIN_REGION_MARGIN = 12
+    #: Half of the size of window around the last known controller position
+    #: (in pixels of the full resolution image) [px]
+    CONTROLLER_WINDOW_HALF_SIZE = 60
+    #: Ratio of the image area, above which the whole image is segmented
+    MAX_REGIONS_AREA_RATIO = 0.5
+    #: Number of frames after which the whole image is segmented to recover lost controllers
+    FULL_FRAME_INTERVAL = 30
+
+    def __init__(self):
+        #: Downscaled gray image of the previous frame
+        self.previous_image = None
+        #: Number of frames since the last segmentation of the whole image
+        self.frames_since_full_frame = 0
+        #: Number of gated frames (segmented only in regions)
+        self.gated_frames_count = 0
+
+    def get_regions(self, frame: Frame, controllers: Iterable[Controller],
+                    scale: float = 1) -> Optional[List[Region]]:
+        """Return regions for segmentation or None if the whole image should be segmented.
+
+        The ``scale`` is the scale of the frame relative to the controllers positions,
+        the controller windows and region margins are scaled by it too.
+        """
+        image_height, image_width = frame.image.shape[:2]
+        if frame.color_space == Frame.YCRCB_COLOR_SPACE:
+            # Luma is the gray image
+            gray_image = cv2.extractChannel(frame.image, 0)
+        else:
+            gray_image = cv2.cvtColor(frame.image, cv2.COLOR_BGR2GRAY)
+        small_image = cv2.resize(gray_image, None,
+                                 fx=MotionGate.DIFFERENCE_SCALE, fy=MotionGate.DIFFERENCE_SCALE,
+                                 interpolation=cv2.INTER_AREA)
+        previous_image, self.previous_image = self.previous_image, small_image
+
+        self.frames_since_full_frame += 1
+        positions = [controller.position for controller in controllers]
+        if (previous_image is None or previous_image.shape != small_image.shape
+                or any(position is None for position in positions)
+                or self.frames_since_full_frame >= MotionGate.FULL_FRAME_INTERVAL):
+            self.frames_since_full_frame = 0
+            return None
+
+        regions = self._get_changed_regions(previous_image, small_image)
+        window_half_size = int(MotionGate.CONTROLLER_WINDOW_HALF_SIZE * scale)
+        for position in positions:
+            regions.append((int(position[0] * scale) - window_half_size,
+                            int(position[1] * scale) - window_half_size,
+                            2 * window_half_size, 2 * window_half_size))
+        margin = max(int(MotionGate.REGION_MARGIN * scale), MotionGate.MIN_REGION_MARGIN)
+        regions = self._merge_regions(
+            [self._add_margin(region, margin, image_width, image_height) for region in regions])
+
+        regions_area = sum(width * height for _, _, width, height in regions)
+        if regions_area > MotionGate.MAX_REGIONS_AREA_RATIO * image_width * image_height:
+            self.frames_since_full_frame = 0
+            return None
+        self.gated_frames_count += 1
+        return regions
+
+    @staticmethod
+    def get_controller_mask(controller: Controller, frame: Frame, regions: Iterable[Region],
+                            blur: bool = True) -> np.ndarray:
+        """Return controller's mask of the whole frame segmented only in regions."""
+        mask = np.zeros(frame.image.shape[:2], dtype=np.uint8)
+        for x_position, y_position, width, height in regions:
+            region_frame = Frame(frame.grabbed,
+                                 frame.image[y_position:y_position + height,
+                                             x_position:x_position + width],
+                                 fps=frame.fps, frame_count=frame.frame_count,
+                                 timestamp=frame.timestamp, color_space=frame.color_space)
+            mask[y_position:y_position + height, x_position:x_position + width] = (
+                controller.get_controller_mask(region_frame, blur))
+        return mask
+
+    @staticmethod
+    def _get_changed_regions(previous_image: np.ndarray, image: np.ndarray) -> List[Region]:
+        """Return bounding boxes of changed areas in the coordinates of the full image."""
+        difference = cv2.absdiff(previous_image, image)
+        _, changed = cv2.threshold(difference, MotionGate.DIFFERENCE_THRESHOLD, 255,
+                                   cv2.THRESH_BINARY)
+        changed = cv2.dilate(changed, None, iterations=1)
+        components_count, _, stats, _ = cv2.connectedComponentsWithStats(changed)
+        # The first component is the background
+        return [tuple(int(value / MotionGate.DIFFERENCE_SCALE) for value in stats[index, :4])
+                for index in range(1, components_count)]
+
+    @staticmethod
+    def _add_margin(region: Region, margin: int, image_width: int, image_height: int) -> Region:
+        """Return region with margin, clipped to the image."""
+        x_start = max(region[0] - margin, 0)
+        y_start = max(region[1] - margin, 0)
+        x_end = min(region[0] + region[2] + margin, image_width)
+        y_end = min(region[1] + region[3] + margin, image_height)
+        return x_start, y_start, max(x_end - x_start, 0), max(y_end - y_start, 0)
+
+    @staticmethod
+    def _merge_regions(regions: List[Region]) -> List[Region]:
+        """Merge overlapping regions, so no pixel is segmented twice."""
+        regions = [region for region in regions if region[2] and region[3]]
+        merged_regions = []
+        for region in sorted(regions):
+            for index, merged_region in enumerate(merged_regions):
+                if (region[0] < merged_region[0] + merged_region[2]
+                        and merged_region[0] < region[0] + region[2]
+                        and region[1] < merged_region[1] + merged_region[3]
+                        and merged_region[1] < region[1] + region[3]):
+                    x_start = min(region[0], merged_region[0])
+                    y_start = min(region[1], merged_region[1])
+                    x_end = max(region[0] + region[2], merged_region[0] + merged_region[2])
+                    y_end = max(region[1] + region[3], merged_region[1] + merged_region[3])
+                    merged_regions[index] = (x_start, y_start, x_end - x_start, y_end - y_start)
+                    break
+            else:
+                merged_regions.append(region)
+        if len(merged_regions) < len(regions):
+            # Merged regions can overlap other regions now
+            return MotionGate._merge_regions(merged_regions)
+        return merged_regions
@@ -1,13 +1,14 @@
 """Module with class representing percussion."""
 
 import logging
-from typing import Tuple
+from typing import Optional, Tuple
 
 import cv2
 import simpleaudio as sa
 import numpy as np
 
 from drums.controllers import Controller
+from drums.samples import OutputFormat, Sample
 
 
 LOG = logging.getLogger(__name__)
@@ -17,14 +18,28 @@ class Percussion:
     """Percussion instrument (e.g. drum or cymbal)."""
 
     def __init__(self, name: str, sound_path: str,
-                 center_position: Tuple[float, float], radius: float):
+                 center_position: Tuple[float, float], radius: float, source: str = None,
+                 sample: Sample = None):
         self.name = name
         self.sound_path = sound_path
         self.center_position = center_position
         self.radius = radius
+        #: Key of the capture source in whose image coordinates the percussion is placed
+        self.source = source
         self.currently_playing_controllers = set()
-        self.sound = sa.WaveObject.from_wave_file(sound_path)
+        #: Object receiving hits by ``play(percussion, controller, volume)`` instead of
+        #: playing the sound (e.g. stub sink in simulation), set by the drum set
+        self.audio_sink = None
+        if sample is None:
+            sample = Sample.from_wave_file(sound_path)
+        # Use already decoded (possibly memory-mapped) sample
+        self.sound = sa.WaveObject(sample.audio_data, sample.num_channels,
+                                   sample.bytes_per_sample, sample.sample_rate)
         self.sound_with_volume = self.sound
+        #: Peak amplitude of the sound in range <0, 1> for volume changes
+        #: (prepared samples know their peak, others are decoded once)
+        self.sound_peak = (sample.peak if sample.peak is not None
+                           else self.get_peak(sample.to_float_frames()))
 
     def add_percussion_position(self, image: np.ndarray):
         """Draw percussion to image."""
@@ -32,36 +47,79 @@ class Percussion:
         return image
 
     def play(self, controller: Controller):
-        """Play the percussion."""
+        """Play the percussion.
+
+        The hit is passed to the audio sink instead of playing, if the sink is set.
+        """
         LOG.debug('Playing drum.')
-        if controller.velocity is not None:
-            volume = np.log2(1 + controller.velocity / controller.velocity_max_volume)
-            self.sound_with_volume = self.set_volume(self.sound, volume)
+        volume = self.get_volume(controller)
+        if self.audio_sink is not None:
+            self.audio_sink.play(self, controller, volume)
+            return
+        if volume is not None:
+            self.sound_with_volume = self.set_volume(self.sound, volume, self.sound_peak)
         self.sound_with_volume.play()
 
     @staticmethod
-    def set_volume(wave_object: sa.WaveObject, volume: float) -> sa.WaveObject:
+    def get_volume(controller: Controller) -> Optional[float]:
+        """Return volume of hit by controller or None if its velocity is unknown."""
+        if controller.velocity is None:
+            return None
+        return np.log2(1 + controller.velocity / controller.velocity_max_volume)
+
+    @staticmethod
+    def set_volume(wave_object: sa.WaveObject, volume: float,
+                   peak: float = None) -> sa.WaveObject:
         """Return wave_object with set absolute volume.
 
-        Minimal volume = 0, maximal volume = 1.
+        Minimal volume = 0, maximal volume = 1. The ``peak`` amplitude of the audio data
+        (in range <0, 1>) is computed if not passed. The audio data can have any sample
+        width supported by ``Sample``. Samples of 1, 2 or 4 bytes are scaled directly
+        in their integer type, which is fast enough to be done at each hit.
 
         The audio data has to be rounded to integers after volume change
         so there can be a slight sound distortion if the volume is repeatedly changed
         on the same audio data. To prevent this, change volume always from the
         original audio data.
         """
-        if volume < 0:
-            volume = 0
-        if volume > 1:
-            volume = 1
-        audio_data = np.frombuffer(wave_object.audio_data, dtype=np.int16)
-        volume_factor = volume * 32767 / np.max(np.abs(audio_data))
-        audio_data = np.int16(audio_data * volume_factor)
+        volume = min(max(volume, 0), 1)
+        sample = Sample(np.frombuffer(wave_object.audio_data, dtype=np.uint8),
+                        wave_object.num_channels, wave_object.bytes_per_sample,
+                        wave_object.sample_rate)
+        if peak is None:
+            peak = Percussion.get_peak(sample.to_float_frames())
+        volume_factor = volume / peak if peak > 0 else 1
+
+        if sample.bytes_per_sample == 1:
+            # 8-bit samples are unsigned with silence at 128
+            audio_data = np.uint8(np.multiply(sample.audio_data.astype(np.int16) - 128,
+                                              np.float32(volume_factor), dtype=np.float32)
+                                  + 128)
+        elif sample.bytes_per_sample == 2:
+            # Single precision is exact for 16-bit samples and twice as fast
+            audio_data = np.multiply(np.frombuffer(wave_object.audio_data, dtype='<i2'),
+                                     np.float32(volume_factor), dtype=np.float32)
+            audio_data = audio_data.astype('<i2')
+        elif sample.bytes_per_sample == 4:
+            audio_data = np.frombuffer(wave_object.audio_data, dtype='<i4') * volume_factor
+            # Rounding of the float peak can exceed the range of 32-bit samples
+            np.clip(audio_data, np.iinfo('<i4').min, np.iinfo('<i4').max, out=audio_data)
+            audio_data = audio_data.astype('<i4')
+        else:
+            # Samples without native integer type are scaled as float frames
+            audio_data = Sample.from_float_frames(
+                sample.to_float_frames() * volume_factor,
+                OutputFormat(sample.sample_rate, sample.num_channels,
+                             sample.bytes_per_sample)).audio_data
         wave_object = sa.WaveObject(
-            audio_data, wave_object.num_channels, wave_object.bytes_per_sample,
-            wave_object.sample_rate)
+            audio_data, sample.num_channels, sample.bytes_per_sample, sample.sample_rate)
         return wave_object
 
+    @staticmethod
+    def get_peak(frames: np.ndarray) -> float:
+        """Return peak amplitude of float frames."""
+        return float(np.max(np.abs(frames))) if frames.size else 0.0
+
     def is_played(self, controller: Controller):
         """Check if the percussion is played."""
         if not controller.position:
@@ -0,0 +1,192 @@
+"""Per-thread profiling of the air drums pipeline."""
+
+from collections import Counter, namedtuple
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Callable, Tuple
+
+
+LOG = logging.getLogger(__name__)
+
+
+#: Profile of a thread. The ``profile`` is None if the functions could not be profiled
+#: by ``cProfile``, then the ``samples`` are counts of the thread's sampled call stacks.
+ThreadProfile = namedtuple('ThreadProfile', 'profile wall_time cpu_time samples')
+
+
+class StackSampler:
+    """Sampler of call stacks of threads in which ``cProfile`` cannot be enabled.
+
+    A daemon thread reads the current stacks of the registered threads every
+    ``SAMPLING_INTERVAL``, so the sampled threads are not slowed down by tracing
+    of each call. Stacks are tuples of functions ``(file name, line number, function name)``
+    (as in ``pstats``) from the outermost call.
+    """
+
+    #: Interval between two samples of the stacks [s]
+    SAMPLING_INTERVAL = 0.005
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Names of the sampled threads by their identifiers
+        self._thread_names = {}
+        # Counts of sampled stacks by thread names
+        self._samples = {}
+        self._sampler_thread = None
+
+    def add_current_thread(self):
+        """Start sampling the current thread."""
+        thread = threading.current_thread()
+        with self._lock:
+            self._thread_names[thread.ident] = thread.name
+            self._samples[thread.name] = Counter()
+            if self._sampler_thread is None:
+                self._sampler_thread = threading.Thread(target=self._sample_stacks,
+                                                        name='stack_sampler', daemon=True)
+                self._sampler_thread.start()
+
+    def remove_current_thread(self) -> Counter:
+        """Stop sampling the current thread and return counts of its sampled stacks."""
+        thread = threading.current_thread()
+        with self._lock:
+            del self._thread_names[thread.ident]
+            return self._samples.pop(thread.name)
+
+    def _sample_stacks(self):
+        while True:
+            time.sleep(StackSampler.SAMPLING_INTERVAL)
+            # There is no public API for stacks of other threads
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            with self._lock:
+                if not self._thread_names:
+                    self._sampler_thread = None
+                    return
+                for thread_id, thread_name in self._thread_names.items():
+                    if thread_id in frames:
+                        self._samples[thread_name][self._get_stack(frames[thread_id])] += 1
+
+    @staticmethod
+    def _get_stack(frame) -> Tuple[Tuple[str, int, str], ...]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+
+class ThreadProfiler:
+    """Profiler of the pipeline threads.
+
+    ``cProfile`` sees only the thread in which it was enabled, so profiling
+    ``play_drums.py`` from outside shows only the output loop. Here every thread target
+    is wrapped in its own profiler, and its wall and CPU time is measured.
+    The stats are written per thread when the targets return.
+
+    Python 3.12+ allows only one active ``cProfile`` profiler, the other threads
+    are profiled by the ``StackSampler`` instead.
+    """
+
+    #: Number of the hottest functions printed in the summary of each thread
+    SUMMARY_FUNCTIONS_COUNT = 5
+
+    def __init__(self, stats_directory: str):
+        #: Directory for the per-thread stats files
+        self.stats_directory = stats_directory
+        #: Profiles of finished threads by thread names
+        self.thread_profiles = {}
+        self._lock = threading.Lock()
+        self._sampler = StackSampler()
+
+    def profile(self, target: Callable[[], None]) -> Callable[[], None]:
+        """Return thread target wrapped in a profiler."""
+        def profiled_target():
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ allows only one active cProfile profiler at a time
+                LOG.info('Thread %s is sampled, another profiler is active.',
+                         threading.current_thread().name)
+                profile = None
+                self._sampler.add_current_thread()
+            wall_start_time = time.perf_counter()
+            cpu_start_time = time.thread_time()
+            try:
+                target()
+            finally:
+                samples = None
+                if profile is not None:
+                    profile.disable()
+                else:
+                    samples = self._sampler.remove_current_thread()
+                thread_profile = ThreadProfile(profile,
+                                               time.perf_counter() - wall_start_time,
+                                               time.thread_time() - cpu_start_time, samples)
+                with self._lock:
+                    self.thread_profiles[threading.current_thread().name] = thread_profile
+
+        return profiled_target
+
+    def write_stats(self):
+        """Write stats of each profiled thread to ``<stats_directory>/<thread_name>.prof``.
+
+        Sampled stacks are written in the folded format of flame graphs
+        to ``<stats_directory>/<thread_name>.folded``.
+        """
+        os.makedirs(self.stats_directory, exist_ok=True)
+        with self._lock:
+            for thread_name, thread_profile in self.thread_profiles.items():
+                if thread_profile.profile is None:
+                    self._write_samples(thread_name, thread_profile.samples)
+                    continue
+                stats_path = os.path.join(self.stats_directory, f'{thread_name}.prof')
+                thread_profile.profile.dump_stats(stats_path)
+                LOG.debug('Profiling stats of thread %s written to %s.', thread_name, stats_path)
+
+    def print_summary(self):
+        """Print CPU time and the hottest functions of each profiled thread."""
+        with self._lock:
+            for thread_name, thread_profile in sorted(self.thread_profiles.items()):
+                cpu_usage = thread_profile.cpu_time / max(thread_profile.wall_time, 1e-9)
+                print(f'Thread {thread_name}: CPU time {thread_profile.cpu_time:.2f} s '
+                      f'of {thread_profile.wall_time:.2f} s ({cpu_usage:.0%})')
+                if thread_profile.profile is None:
+                    self._print_samples_summary(thread_profile.samples)
+                    continue
+                stats = pstats.Stats(thread_profile.profile)
+                hottest_functions = sorted(stats.stats.items(),  # pylint: disable=no-member
+                                           key=lambda item: item[1][2], reverse=True)
+                for function, (_, calls_count, total_time, _, _) in hottest_functions[
+                        :ThreadProfiler.SUMMARY_FUNCTIONS_COUNT]:
+                    file_name, line_number, function_name = function
+                    print(f'    {total_time:8.3f} s {calls_count:8d} calls  '
+                          f'{function_name} ({os.path.basename(file_name)}:{line_number})')
+
+    def _write_samples(self, thread_name: str, samples: Counter):
+        samples_path = os.path.join(self.stats_directory, f'{thread_name}.folded')
+        with open(samples_path, 'w', encoding='utf-8') as samples_file:
+            for stack, samples_count in samples.items():
+                functions = ';'.join(f'{function_name} ({os.path.basename(file_name)}:'
+                                     f'{line_number})'
+                                     for file_name, line_number, function_name in stack)
+                samples_file.write(f'{functions} {samples_count}\n')
+        LOG.debug('Sampled stacks of thread %s written to %s.', thread_name, samples_path)
+
+    @staticmethod
+    def _print_samples_summary(samples: Counter):
+        """Print functions with the most samples on the top of the stack."""
+        functions_samples = Counter()
+        for stack, samples_count in samples.items():
+            functions_samples[stack[-1]] += samples_count
+        for function, samples_count in functions_samples.most_common(
+                ThreadProfiler.SUMMARY_FUNCTIONS_COUNT):
+            file_name, line_number, function_name = function
+            print(f'    {samples_count * StackSampler.SAMPLING_INTERVAL:8.3f} s '
+                  f'{samples_count:8d} samples  '
+                  f'{function_name} ({os.path.basename(file_name)}:{line_number})')
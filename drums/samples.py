@@ -0,0 +1,133 @@
+"""Drum samples loading and preparation for playback."""
+
+from collections import namedtuple
+import logging
+import wave
+
+import numpy as np
+
+
+LOG = logging.getLogger(__name__)
+
+
+#: Format of the audio output device
+OutputFormat = namedtuple('OutputFormat', 'sample_rate num_channels bytes_per_sample')
+
+
+class Sample(namedtuple('Sample', 'audio_data num_channels bytes_per_sample sample_rate peak',
+                        defaults=(None,))):
+    """Data class representing decoded drum sample.
+
+    The ``audio_data`` are raw interleaved frames as an array of bytes.
+    The ``peak`` amplitude is in range <0, 1> (None if it is not known).
+    """
+
+    #: Default format of the audio output device (simpleaudio cannot query it)
+    OUTPUT_FORMAT = OutputFormat(sample_rate=44100, num_channels=2, bytes_per_sample=2)
+    #: Level relative to the peak, from which the sound is considered audible
+    ONSET_THRESHOLD = 0.02
+    #: Time kept before the detected onset, so the attack is not cut [s]
+    ONSET_PRE_ROLL = 0.0005
+
+    __slots__ = ()
+
+    @staticmethod
+    def from_wave_file(sound_path: str) -> 'Sample':
+        """Read sample from the wave file."""
+        with wave.open(sound_path, 'rb') as wave_file:
+            audio_data = wave_file.readframes(wave_file.getnframes())
+            return Sample(np.frombuffer(audio_data, dtype=np.uint8),
+                          wave_file.getnchannels(),
+                          wave_file.getsampwidth(),
+                          wave_file.getframerate())
+
+    def prepare(self, output_format: OutputFormat = OUTPUT_FORMAT) -> 'Sample':
+        """Return sample prepared for playback with the lowest latency.
+
+        Leading silence is trimmed, the peak is normalized to the maximal amplitude
+        and the sample is converted to the format of the output device,
+        so nothing has to be done at playback.
+        """
+        frames = self.to_float_frames()
+        frames = Sample.trim_leading_silence(frames, self.sample_rate)
+        frames = Sample.convert_channels(frames, output_format.num_channels)
+        frames = Sample.resample(frames, self.sample_rate, output_format.sample_rate)
+        peak = np.max(np.abs(frames)) if frames.size else 0
+        if peak > 0:
+            frames = frames / peak
+        LOG.debug('Sample prepared: %s frames trimmed to %s.',
+                  len(self.audio_data) // (self.num_channels * self.bytes_per_sample),
+                  len(frames))
+        # The peak is known after normalization, so it is not computed at each start
+        return Sample.from_float_frames(frames, output_format)._replace(
+            peak=1.0 if peak > 0 else 0.0)
+
+    def to_float_frames(self) -> np.ndarray:
+        """Return audio data as float frames (frames x channels) in range <-1, 1>."""
+        audio_bytes = np.asarray(self.audio_data, dtype=np.uint8)
+        if self.bytes_per_sample == 1:
+            # 8-bit wave files are unsigned
+            samples = (audio_bytes.astype(np.float32) - 128) / 128
+        elif self.bytes_per_sample == 3:
+            samples_bytes = audio_bytes.reshape(-1, 3).astype(np.int32)
+            samples = (samples_bytes[:, 0] | samples_bytes[:, 1] << 8
+                       | samples_bytes[:, 2] << 16)
+            samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+            samples = samples.astype(np.float32) / (1 << 23)
+        elif self.bytes_per_sample in (2, 4):
+            dtype = np.dtype(f'<i{self.bytes_per_sample}')
+            samples = (np.frombuffer(audio_bytes.tobytes(), dtype=dtype).astype(np.float32)
+                       / np.iinfo(dtype).max)
+        else:
+            raise ValueError(f'Unsupported sample width {self.bytes_per_sample} bytes.')
+        return samples.reshape(-1, self.num_channels)
+
+    @staticmethod
+    def from_float_frames(frames: np.ndarray, output_format: OutputFormat) -> 'Sample':
+        """Return sample with float frames encoded to contiguous audio data."""
+        frames = np.clip(frames, -1, 1)
+        if output_format.bytes_per_sample == 1:
+            samples = np.round(frames * 127 + 128).astype(np.uint8)
+        elif output_format.bytes_per_sample == 3:
+            samples = np.round(frames.astype(np.float64) * ((1 << 23) - 1)).astype('<i4')
+            # Keep the three lower bytes of little-endian 32-bit samples
+            samples = samples.reshape(-1, 1).view(np.uint8)[:, :3]
+        elif output_format.bytes_per_sample in (2, 4):
+            dtype = np.dtype(f'<i{output_format.bytes_per_sample}')
+            samples = np.round(frames.astype(np.float64) * np.iinfo(dtype).max).astype(dtype)
+        else:
+            raise ValueError(f'Unsupported output sample width '
+                             f'{output_format.bytes_per_sample} bytes.')
+        audio_data = np.frombuffer(np.ascontiguousarray(samples).tobytes(), dtype=np.uint8)
+        return Sample(audio_data, output_format.num_channels,
+                      output_format.bytes_per_sample, output_format.sample_rate)
+
+    @staticmethod
+    def trim_leading_silence(frames: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Return frames without silence before the onset."""
+        levels = np.max(np.abs(frames), axis=1) if frames.size else frames
+        if not levels.size or levels.max() == 0:
+            return frames
+        onset_index = int(np.argmax(levels >= Sample.ONSET_THRESHOLD * levels.max()))
+        start_index = max(onset_index - int(Sample.ONSET_PRE_ROLL * sample_rate), 0)
+        return frames[start_index:]
+
+    @staticmethod
+    def convert_channels(frames: np.ndarray, num_channels: int) -> np.ndarray:
+        """Return frames with changed number of channels."""
+        if frames.shape[1] == num_channels:
+            return frames
+        # Mix down to mono, then duplicate to all output channels
+        mono_frames = frames.mean(axis=1, keepdims=True)
+        return np.repeat(mono_frames, num_channels, axis=1)
+
+    @staticmethod
+    def resample(frames: np.ndarray, sample_rate: int, output_sample_rate: int) -> np.ndarray:
+        """Return frames resampled to the output sample rate by linear interpolation."""
+        if sample_rate == output_sample_rate or not frames.size:
+            return frames
+        frames_count = int(round(len(frames) * output_sample_rate / sample_rate))
+        times = np.arange(len(frames)) / sample_rate
+        output_times = np.arange(frames_count) / output_sample_rate
+        return np.stack([np.interp(output_times, times, frames[:, channel])
+                         for channel in range(frames.shape[1])], axis=1)
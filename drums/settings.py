@@ -4,22 +4,51 @@ from typing import Dict, Any
 
 import yaml
 
+from drums.samples import OutputFormat, Sample
+from drums.settings_cache import CompiledSettings, SettingsCache
+
+
+#: YAML loader, the C implementation is used if PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 class Settings:
     """Settings for air drums."""
 
-    def __init__(self, settings_file_path: str):
+    def __init__(self, settings_file_path: str,
+                 cache_directory: str = SettingsCache.CACHE_DIRECTORY):
         #: Relative path to the settings file
         self.settings_file_path = settings_file_path
-        #: Air drums settings
-        self.settings = self.get_settings()
+        #: Cache with compiled settings (caching is disabled if not set)
+        self.cache = SettingsCache(cache_directory) if cache_directory else None
+
+        compiled_settings = self.cache.load(settings_file_path) if self.cache else None
+        if compiled_settings is None:
+            #: Air drums settings
+            self.settings = self.get_settings()
+            #: Decoded drum samples by their sound paths
+            self.samples = self.get_samples()
+            if self.cache:
+                self.cache.save(settings_file_path,
+                                CompiledSettings(self.settings, self.samples))
+        else:
+            self.settings, self.samples = compiled_settings
 
     def get_settings(self) -> Dict[str, Any]:
         """Return settings."""
         with open(self.settings_file_path, 'r') as settings_file:
-            settings = yaml.load(settings_file)
+            settings = yaml.load(settings_file, Loader=YAML_LOADER)
         return settings
 
+    def get_samples(self) -> Dict[str, Sample]:
+        """Return samples of all percussion sounds prepared for the audio output."""
+        output_format = OutputFormat(**{**Sample.OUTPUT_FORMAT._asdict(),
+                                        **self.settings.get('audio_output', {})})
+        sound_paths = {percussion['sound_path']
+                       for percussion in self.settings['percussion'].values()}
+        return {sound_path: Sample.from_wave_file(sound_path).prepare(output_format)
+                for sound_path in sound_paths}
+
     def save_settings(self):
         """Save settings to the settings file."""
         with open(self.settings_file_path, 'w') as settings_file:
@@ -0,0 +1,141 @@
+"""Cache of compiled settings with precomputed runtime artifacts."""
+
+from collections import namedtuple
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+
+from drums.samples import Sample
+
+
+LOG = logging.getLogger(__name__)
+
+
+CompiledSettings = namedtuple('CompiledSettings', 'settings samples')
+
+
+class SettingsCache:
+    """Cache of parsed settings and decoded drum samples.
+
+    Each cache entry is a directory named by the content hash of the settings file.
+    It contains the parsed settings with content hashes of the referenced sound files
+    in ``manifest.json`` and the samples audio data as ``.npy`` arrays, which are
+    memory-mapped when loading. The entry is used only if no sound file has changed.
+    Nothing is unpickled, so a tampered cache entry cannot run code.
+    """
+
+    #: Default directory with the cache entries
+    CACHE_DIRECTORY = '.air_drums_cache'
+    #: Maximal number of kept cache entries
+    MAX_ENTRIES_COUNT = 10
+    #: Name of the file with parsed settings and samples metadata in a cache entry
+    MANIFEST_FILE_NAME = 'manifest.json'
+    #: Version of the cache format, entries of other versions are ignored
+    FORMAT_VERSION = 4
+
+    def __init__(self, cache_directory: str = CACHE_DIRECTORY):
+        #: Directory with the cache entries
+        self.cache_directory = cache_directory
+
+    def load(self, settings_file_path: str) -> Optional[CompiledSettings]:
+        """Return compiled settings from cache or None if they are missing or outdated.
+
+        A damaged entry (e.g. with a missing sample file) is removed, so it is rebuilt.
+        """
+        entry_directory = self._get_entry_directory(settings_file_path)
+        manifest_path = os.path.join(entry_directory, SettingsCache.MANIFEST_FILE_NAME)
+        if not os.path.exists(manifest_path):
+            LOG.debug('Settings cache miss for %s.', settings_file_path)
+            return None
+        try:
+            return self._load_entry(entry_directory, manifest_path)
+        except (KeyError, TypeError, ValueError, OSError) as error:
+            LOG.warning('Damaged settings cache entry %s is removed: %r',
+                        entry_directory, error)
+            shutil.rmtree(entry_directory, ignore_errors=True)
+            return None
+
+    def _load_entry(self, entry_directory: str,
+                    manifest_path: str) -> Optional[CompiledSettings]:
+        """Return compiled settings from cache entry or None if it is outdated."""
+        with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+
+        if (not isinstance(manifest, dict)
+                or manifest.get('format_version') != SettingsCache.FORMAT_VERSION):
+            return None
+        samples = {}
+        for sound_path, sample_metadata in manifest['samples'].items():
+            if self._get_file_hash(sound_path) != sample_metadata['hash']:
+                LOG.debug('Settings cache outdated, %s has changed.', sound_path)
+                return None
+            audio_data = np.load(os.path.join(entry_directory, sample_metadata['file_name']),
+                                 mmap_mode='r')
+            samples[sound_path] = Sample(audio_data, *sample_metadata['parameters'],
+                                         sample_metadata['peak'])
+
+        LOG.debug('Settings loaded from cache %s.', entry_directory)
+        return CompiledSettings(manifest['settings'], samples)
+
+    def save(self, settings_file_path: str, compiled_settings: CompiledSettings):
+        """Save compiled settings to cache."""
+        entry_directory = self._get_entry_directory(settings_file_path)
+        temporary_directory = f'{entry_directory}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(temporary_directory, exist_ok=True)
+            samples_metadata = {}
+            for index, (sound_path, sample) in enumerate(compiled_settings.samples.items()):
+                file_name = f'sample_{index}.npy'
+                np.save(os.path.join(temporary_directory, file_name),
+                        np.ascontiguousarray(sample.audio_data))
+                samples_metadata[sound_path] = {
+                    'hash': self._get_file_hash(sound_path),
+                    'file_name': file_name,
+                    'parameters': [int(parameter) for parameter in (
+                        sample.num_channels, sample.bytes_per_sample, sample.sample_rate)],
+                    'peak': None if sample.peak is None else float(sample.peak)
+                }
+            manifest = {'format_version': SettingsCache.FORMAT_VERSION,
+                        'settings': compiled_settings.settings,
+                        'samples': samples_metadata}
+            with open(os.path.join(temporary_directory, SettingsCache.MANIFEST_FILE_NAME),
+                      'w', encoding='utf-8') as manifest_file:
+                json.dump(manifest, manifest_file)
+
+            # Replace the entry at once, so other processes never see a partial entry
+            shutil.rmtree(entry_directory, ignore_errors=True)
+            os.rename(temporary_directory, entry_directory)
+            LOG.debug('Settings saved to cache %s.', entry_directory)
+        except (OSError, TypeError, ValueError) as error:
+            # Settings with values that JSON cannot represent are not cached
+            LOG.warning('Settings cannot be saved to cache: %s', error)
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        self._remove_old_entries()
+
+    def _get_entry_directory(self, settings_file_path: str) -> str:
+        return os.path.join(self.cache_directory, self._get_file_hash(settings_file_path))
+
+    def _remove_old_entries(self):
+        """Keep only ``MAX_ENTRIES_COUNT`` newest entries."""
+        try:
+            entries = [os.path.join(self.cache_directory, name)
+                       for name in os.listdir(self.cache_directory)]
+        except OSError:
+            return
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for entry in entries[SettingsCache.MAX_ENTRIES_COUNT:]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+    @staticmethod
+    def _get_file_hash(file_path: str) -> Optional[str]:
+        """Return SHA-256 hash of the file content or None if it cannot be read."""
+        try:
+            with open(file_path, 'rb') as hashed_file:
+                return hashlib.sha256(hashed_file.read()).hexdigest()
+        except OSError:
+            return None
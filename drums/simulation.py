@@ -0,0 +1,342 @@
+"""Synthetic scenes for evaluating tracking and playing without camera."""
+
+from collections import namedtuple
+import logging
+import time
+from typing import Dict, List, Sequence
+
+import cv2
+import numpy as np
+
+from drums.controllers import Calibrator, Controller, YCrCb
+from drums.drum_set import DrumSet
+from drums.load_shedding import LoadShedder, QualityLevel
+from drums.motion_gate import MotionGate
+from drums.percussion import Percussion
+from drums.streaming import ImageSize, InputVideoStream
+from drums.tracker import Tracker
+
+
+LOG = logging.getLogger(__name__)
+
+
+#: Scripted stroke of a controller to a percussion, hitting it at ``hit_time`` [s]
+Stroke = namedtuple('Stroke', 'controller_key percussion_name hit_time duration')
+#: Hit of a percussion by a controller
+Hit = namedtuple('Hit', 'timestamp controller_key percussion_name')
+#: Parameters of the rendered scene. The ``noise`` is the standard deviation
+#: of the Gaussian noise added to each frame. With ``yuy2_output``, frames are output
+#: packed in raw YUY2 as by a camera capturing raw YUV frames.
+SceneParameters = namedtuple('SceneParameters', 'image_size fps background noise seed yuy2_output',
+                             defaults=(ImageSize(640, 480), InputVideoStream.FPS,
+                                       'texture', 5, 0, False))
+#: Parameters of the scripted strokes (see ``create_strokes``), durations are in seconds
+StrokeParameters = namedtuple(
+    'StrokeParameters',
+    'duration interval stroke_duration fast_stroke_duration fast_strokes_ratio seed',
+    defaults=(10, 0.6, 0.2, 0.05, 0.25, 0))
+#: Trajectory of a rendered controller, its position is interpolated between keyframes
+Trajectory = namedtuple('Trajectory', 'color times positions')
+#: Results of the simulation compared to the ground truth
+SimulationReport = namedtuple(
+    'SimulationReport',
+    'true_hits_count detected_hits_count missed_hits_count false_hits_count '
+    'mean_timing_error max_timing_error frames_count fps')
+
+
+class StubAudioSink:
+    """Audio sink recording hits instead of playing them."""
+
+    def __init__(self):
+        #: Recorded hits
+        self.hits = []
+
+    def play(self, percussion: Percussion, controller: Controller, volume: float):
+        """Record hit at the timestamp of the last controller's position."""
+        LOG.debug('Hit of %s by %s with volume %s.', percussion.name, controller.name, volume)
+        self.hits.append(Hit(controller.positions_in_time[-1].timestamp,
+                             controller.key, percussion.name))
+
+
+class SyntheticScene:
+    """Scene with colored controller heads moving along scripted trajectories.
+
+    Mimics ``cv2.VideoCapture``, so it can be read by ``InputVideoStream``.
+    The controllers are rendered mirrored, so after the input stream preprocessing
+    they are at their scripted positions. Before a stroke, the controller is held
+    ``LIFT`` pixels above the percussion (or below it at the top of the image),
+    then it moves to the percussion center and back.
+    """
+
+    #: Height above the percussion edge, from which the strokes start [px]
+    LIFT = 80
+    #: Radius of the rendered controller heads [px]
+    HEAD_RADIUS = 12
+    #: Time step for computing the ground truth hits [s]
+    GROUND_TRUTH_TIME_STEP = 0.001
+    #: Supported backgrounds
+    BACKGROUNDS = ('plain', 'gradient', 'texture')
+
+    def __init__(self, drum_set: DrumSet, strokes: Sequence[Stroke],
+                 parameters: SceneParameters = SceneParameters()):
+        self.drum_set = drum_set
+        #: Parameters of the rendered scene
+        self.parameters = parameters
+        #: Index of the next rendered frame
+        self.frame_index = 0
+        #: Timestamp of the last rendered frame [s]
+        self.timestamp = None
+        #: Total time spent by rendering, so it can be excluded from measurements [s]
+        self.render_time = 0
+        #: Duration of the scene [s]
+        self.duration = max((stroke.hit_time + stroke.duration for stroke in strokes),
+                            default=0) + 0.5
+        self._random_generator = np.random.RandomState(parameters.seed)
+        self._background = self._create_background(parameters.background)
+        strokes = sorted(strokes, key=lambda stroke: stroke.hit_time)
+        self._trajectories = {
+            controller.key: Trajectory(self._get_controller_color(controller),
+                                       *self._get_keyframes(controller.key, strokes))
+            for controller in drum_set.controllers}
+        self._last_image = None
+
+    def get_position(self, controller_key: str, timestamp: float) -> np.ndarray:
+        """Return scripted position of controller at timestamp."""
+        _, times, positions = self._trajectories[controller_key]
+        return np.array([np.interp(timestamp, times, positions[:, 0]),
+                         np.interp(timestamp, times, positions[:, 1])])
+
+    def get_true_hits(self) -> List[Hit]:
+        """Return hits of percussion by controllers entering them, in time order."""
+        timestamps = np.arange(0, self.duration, SyntheticScene.GROUND_TRUTH_TIME_STEP)
+        hits = []
+        for controller_key in self._trajectories:
+            positions = self.get_position(controller_key, timestamps).T
+            for percussion in self.drum_set.percussion:
+                inside = (np.linalg.norm(positions - np.asarray(percussion.center_position),
+                                         axis=1) < percussion.radius)
+                entries = np.flatnonzero(inside[1:] & ~inside[:-1]) + 1
+                if inside[0]:
+                    entries = np.insert(entries, 0, 0)
+                hits.extend(Hit(timestamps[entry], controller_key, percussion.name)
+                            for entry in entries)
+        return sorted(hits)
+
+    def calibrate_ycrcb(self):
+        """Calibrate YCrCb colors of controllers around their rendered colors."""
+        for controller in self.drum_set.controllers:
+            bgr = np.uint8([[self._trajectories[controller.key].color]])
+            average_color = YCrCb(*cv2.cvtColor(bgr, cv2.COLOR_BGR2YCrCb)[0, 0].tolist())
+            ycrcb_low, ycrcb_high = Calibrator.get_ycrcb_range(average_color)
+            controller.color_range = controller.color_range._replace(ycrcb_low=ycrcb_low,
+                                                                     ycrcb_high=ycrcb_high)
+
+    def render(self, timestamp: float) -> np.ndarray:
+        """Return camera image of the scene at timestamp (BGR or packed YUY2)."""
+        render_start_time = time.perf_counter()
+        image = self._background.copy()
+        # Scale between the camera image and the image after input stream preprocessing
+        output_width = min(self.parameters.image_size.width,
+                           InputVideoStream.MAX_OUTPUT_IMAGE_WIDTH)
+        scale = self.parameters.image_size.width / output_width
+        for controller_key, trajectory in self._trajectories.items():
+            position = self.get_position(controller_key, timestamp)
+            # Mirror the position, the input stream flips the image back
+            center = (int(round((output_width - 1 - position[0]) * scale)),
+                      int(round(position[1] * scale)))
+            cv2.circle(image, center, int(SyntheticScene.HEAD_RADIUS * scale),
+                       trajectory.color, -1)
+        if self.parameters.noise:
+            noise = self._random_generator.normal(0, self.parameters.noise, image.shape)
+            image = np.clip(image + noise, 0, 255).astype(np.uint8)
+        if self.parameters.yuy2_output:
+            image = self.pack_yuy2(image)
+        self.render_time += time.perf_counter() - render_start_time
+        return image
+
+    @staticmethod
+    def pack_yuy2(image: np.ndarray) -> np.ndarray:
+        """Return BGR image packed to raw YUY2 with pixels as Y0 U Y1 V.
+
+        Both pixels of each pair share chroma, which is averaged over the pair.
+        """
+        luma, chroma_red, chroma_blue = cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2YCrCb))
+        height, width = luma.shape
+        # Alternate U (Cb) and V (Cr) of the pairs of pixels
+        chroma = cv2.merge([cv2.resize(channel, (width // 2, height),
+                                       interpolation=cv2.INTER_AREA)
+                            for channel in (chroma_blue, chroma_red)]).reshape(height, width)
+        return cv2.merge([luma, chroma])
+
+    def read(self):
+        """Render the next frame as ``cv2.VideoCapture.read``."""
+        self.grab()
+        return self.retrieve()
+
+    def grab(self) -> bool:
+        """Move to the next frame as ``cv2.VideoCapture.grab``."""
+        self.timestamp = self.frame_index / self.parameters.fps
+        self.frame_index += 1
+        self._last_image = None
+        return self.timestamp <= self.duration
+
+    def retrieve(self):
+        """Render the grabbed frame as ``cv2.VideoCapture.retrieve``."""
+        if self._last_image is None:
+            self._last_image = self.render(self.timestamp)
+        return True, self._last_image
+
+    def get(self, property_id: int) -> float:
+        """Return image size, FPS and codec as ``cv2.VideoCapture.get``."""
+        if property_id == cv2.CAP_PROP_FOURCC:
+            return (InputVideoStream.YUV_CODEC if self.parameters.yuy2_output
+                    else InputVideoStream.CODEC)
+        if property_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.parameters.image_size.width
+        if property_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.parameters.image_size.height
+        if property_id == cv2.CAP_PROP_FPS:
+            return self.parameters.fps
+        return 0
+
+    @staticmethod
+    def set(property_id: int, value: float) -> bool:  # pylint: disable=unused-argument
+        """Ignore setting of properties, the scene has fixed properties."""
+        return False
+
+    def release(self):
+        """Release the scene as ``cv2.VideoCapture.release``."""
+
+    def _get_keyframes(self, controller_key: str, strokes: Sequence[Stroke]):
+        """Return times and positions of the controller's trajectory keyframes."""
+        percussion_by_names = {percussion.name: percussion
+                               for percussion in self.drum_set.percussion}
+        keyframes = []
+        for stroke in strokes:
+            if stroke.controller_key != controller_key:
+                continue
+            percussion = percussion_by_names[stroke.percussion_name]
+            center = np.asarray(percussion.center_position, dtype=float)
+            above = center - (0, percussion.radius + SyntheticScene.LIFT)
+            if above[1] < SyntheticScene.HEAD_RADIUS:
+                # Strike from below the percussion at the top of the image
+                above = center + (0, percussion.radius + SyntheticScene.LIFT)
+            keyframes.extend([(stroke.hit_time - stroke.duration / 2, above),
+                              (stroke.hit_time, center),
+                              (stroke.hit_time + stroke.duration / 2, above)])
+        if not keyframes:
+            # The controller stays out of the image
+            keyframes = [(0, np.array([-100, -100]))]
+        times = np.array([keyframe[0] for keyframe in keyframes])
+        positions = np.array([keyframe[1] for keyframe in keyframes])
+        return times, positions
+
+    def _create_background(self, background: str) -> np.ndarray:
+        image_size = self.parameters.image_size
+        shape = (image_size.height, image_size.width, 3)
+        if background == 'plain':
+            return np.full(shape, 128, dtype=np.uint8)
+        if background == 'gradient':
+            gradient = np.linspace(40, 220, image_size.width, dtype=np.uint8)
+            return np.repeat(np.tile(gradient[None, :, None], (image_size.height, 1, 1)),
+                             3, axis=2)
+        if background == 'texture':
+            # Random gray blocks with a slight color tint, like a room behind the drummer
+            texture_shape = (shape[0] // 16, shape[1] // 16)
+            texture = (self._random_generator.randint(30, 226, texture_shape + (1,))
+                       + self._random_generator.randint(-20, 21, texture_shape + (3,)))
+            return cv2.resize(texture.astype(np.uint8), (shape[1], shape[0]),
+                              interpolation=cv2.INTER_LINEAR)
+        raise ValueError(f'Unknown background {background!r}, '
+                         f'use one of {", ".join(SyntheticScene.BACKGROUNDS)}.')
+
+    @staticmethod
+    def _get_controller_color(controller: Controller):
+        """Return BGR color in the middle of the controller's HSV range."""
+        color_range = controller.color_range
+        hsv = np.uint8([[np.add(color_range.hsv_low, color_range.hsv_high) / 2]])
+        return tuple(int(channel) for channel in cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0, 0])
+
+
+def create_strokes(controller_keys: Sequence[str], percussion_names: Sequence[str],
+                   parameters: StrokeParameters = StrokeParameters()) -> List[Stroke]:
+    """Return strokes of controllers to random percussion in regular intervals.
+
+    Every controller hits once per ``interval``, the controllers are shifted in time.
+    Part of the strokes given by ``fast_strokes_ratio`` are fast strokes.
+    """
+    random_generator = np.random.RandomState(parameters.seed)
+    strokes = []
+    for index, controller_key in enumerate(controller_keys):
+        hit_time = parameters.interval * (1 + index / len(controller_keys))
+        while hit_time < parameters.duration:
+            is_fast = random_generator.uniform() < parameters.fast_strokes_ratio
+            # Jitter the hit time, so the hits do not coincide with frames
+            jitter = random_generator.uniform(-0.05, 0.05)
+            strokes.append(Stroke(controller_key,
+                                  percussion_names[random_generator.randint(len(percussion_names))],
+                                  hit_time + jitter,
+                                  parameters.fast_stroke_duration if is_fast
+                                  else parameters.stroke_duration))
+            hit_time += parameters.interval
+    return strokes
+
+
+def compare_hits(true_hits: Sequence[Hit], detected_hits: Sequence[Hit],
+                 tolerance: float = 0.15) -> Dict[str, List]:
+    """Match detected hits to the true hits of the same controller and percussion.
+
+    Return matched pairs, missed true hits and false detected hits.
+    A detected hit matches the earliest unmatched true hit within ``tolerance`` seconds.
+    """
+    unmatched_detected_hits = sorted(detected_hits)
+    matched_hits, missed_hits = [], []
+    for true_hit in sorted(true_hits):
+        for detected_hit in unmatched_detected_hits:
+            if (detected_hit[1:] == true_hit[1:]
+                    and abs(detected_hit.timestamp - true_hit.timestamp) <= tolerance):
+                matched_hits.append((true_hit, detected_hit))
+                unmatched_detected_hits.remove(detected_hit)
+                break
+        else:
+            missed_hits.append(true_hit)
+    return {'matched': matched_hits, 'missed': missed_hits, 'false': unmatched_detected_hits}
+
+
+def run_simulation(drum_set: DrumSet, scene: SyntheticScene, audio_sink: StubAudioSink,
+                   quality: QualityLevel = LoadShedder.QUALITY_LEVELS[0],
+                   motion_gate: MotionGate = None,
+                   yuv_capture: bool = False) -> SimulationReport:
+    """Feed the scene through the input stream, tracker and drum set and compare hits.
+
+    The ``drum_set`` has to be created with the ``audio_sink``. With ``yuv_capture``,
+    the controllers are tracked in YCrCb and their colors have to be calibrated
+    by ``SyntheticScene.calibrate_ycrcb``. The input stream unpacks the raw YUY2 frames
+    of the scene with ``yuy2_output``, otherwise it converts the BGR frames to YCrCb.
+    """
+    input_video_stream = InputVideoStream(capture=scene, yuv_capture=yuv_capture)
+    frames_count = 0
+    start_time = time.perf_counter()
+    while scene.timestamp is None or scene.timestamp < scene.duration:
+        frame = input_video_stream.read_frame()
+        # Use the scene time instead of the wall time
+        frame.timestamp = scene.timestamp
+        Tracker.track_controllers_in_frame(frame, drum_set.controllers, quality, motion_gate)
+        drum_set.play()
+        frames_count += 1
+    # Rendering of the scene is not a part of the measured pipeline
+    fps = frames_count / (time.perf_counter() - start_time - scene.render_time)
+
+    true_hits = scene.get_true_hits()
+    comparison = compare_hits(true_hits, audio_sink.hits)
+    timing_errors = [detected_hit.timestamp - true_hit.timestamp
+                     for true_hit, detected_hit in comparison['matched']]
+    return SimulationReport(
+        true_hits_count=len(true_hits),
+        detected_hits_count=len(audio_sink.hits),
+        missed_hits_count=len(comparison['missed']),
+        false_hits_count=len(comparison['false']),
+        mean_timing_error=float(np.mean(timing_errors)) if timing_errors else float('nan'),
+        max_timing_error=float(np.max(np.abs(timing_errors))) if timing_errors else float('nan'),
+        frames_count=frames_count,
+        fps=fps)
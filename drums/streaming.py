@@ -6,6 +6,7 @@ import time
 from typing import Deque, TYPE_CHECKING
 
 import cv2
+import numpy as np
 
 from drums.frame import Frame
 if TYPE_CHECKING:
@@ -30,16 +31,27 @@ class InputVideoStream:
     MAX_OUTPUT_IMAGE_WIDTH = 640
     #: Sleep interval between reading two frames from the stream.
     LOOP_SLEEP = 0.001
-    #: Codec code of the stream (MJPG). Could be changed to 844715353 (YUY2)
+    #: Codec code of the stream (MJPG)
     CODEC = 1196444237
+    #: Codec code of the stream with raw YUV frames (YUY2)
+    YUV_CODEC = 844715353
     #: FPS of the input stream (if the stream source supports it).
     FPS = 30
 
-    def __init__(self, frames: Deque[Frame] = None, stream_source: int = STREAM_SOURCE):
+    def __init__(self, frames: Deque[Frame] = None, stream_source: int = STREAM_SOURCE,
+                 decoupled_capture: bool = False, capture: cv2.VideoCapture = None,
+                 yuv_capture: bool = False):
         LOG.debug('Initializing input video stream.')
-        self.stream = cv2.VideoCapture(stream_source)
+        # Already opened capture (e.g. synthetic scene) is used instead of the stream source
+        self.stream = capture if capture is not None else cv2.VideoCapture(stream_source)
         self.image_size = ImageSize(None, None)
         self.frames = frames
+        #: If only frames that will be consumed should be decoded (see ``start_stream``)
+        self.decoupled_capture = decoupled_capture
+        #: If raw YUV frames should be captured and passed on in YCrCb without decoding to BGR
+        self.yuv_capture = yuv_capture
+        #: Size of the image captured by the camera
+        self.input_image_size = ImageSize(None, None)
         self.stream_enabled = True
         self.frame_count = 0
         self.fps = 0
@@ -52,26 +64,45 @@ class InputVideoStream:
     def _setup_stream(self):
         """Set up image size."""
         self.stream.set(cv2.CAP_PROP_FPS, InputVideoStream.FPS)
-        self.stream.set(cv2.CAP_PROP_FOURCC, InputVideoStream.CODEC)
+        if self.yuv_capture:
+            self.stream.set(cv2.CAP_PROP_FOURCC, InputVideoStream.YUV_CODEC)
+            self.stream.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        else:
+            self.stream.set(cv2.CAP_PROP_FOURCC, InputVideoStream.CODEC)
         self.stream.set(cv2.CAP_PROP_FRAME_WIDTH,
                         InputVideoStream.MAX_INPUT_IMAGE_WIDTH_OR_HEIGHT)
         self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT,
                         InputVideoStream.MAX_INPUT_IMAGE_WIDTH_OR_HEIGHT)
-
-        input_image_size = ImageSize(
-            width=self.stream.get(cv2.CAP_PROP_FRAME_WIDTH),
-            height=self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if (self.yuv_capture
+                and int(self.stream.get(cv2.CAP_PROP_FOURCC)) != InputVideoStream.YUV_CODEC):
+            # Raw frames in other formats cannot be unpacked, let the backend decode them
+            LOG.warning('The camera does not support raw YUY2 capture, '
+                        'decoded frames will be converted to YCrCb.')
+            self.stream.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+
+        self.input_image_size = ImageSize(
+            width=int(self.stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
         image_scaling_factor = (
-            min(input_image_size.width, InputVideoStream.MAX_OUTPUT_IMAGE_WIDTH)
-            / input_image_size.width)
+            min(self.input_image_size.width, InputVideoStream.MAX_OUTPUT_IMAGE_WIDTH)
+            / self.input_image_size.width)
         self.image_size = ImageSize(
-            width=int(input_image_size.width * image_scaling_factor),
-            height=int(input_image_size.height * image_scaling_factor))
+            width=int(self.input_image_size.width * image_scaling_factor),
+            height=int(self.input_image_size.height * image_scaling_factor))
 
     def start_stream(self):
-        """Start input video stream."""
+        """Start input video stream.
+
+        In the decoupled capture mode, the frames are grabbed continuously so the camera
+        buffer stays fresh, but they are decoded and preprocessed only when the consumer
+        has taken the previous frame from ``frames``. The ``frames`` queue should have
+        ``maxlen=1`` in this mode, so it works as a slot with the latest frame.
+        """
         LOG.debug('Starting input video stream.')
         self.stream_start_time = time.time()
+        if self.decoupled_capture:
+            self._start_decoupled_stream()
+            return
         while self.stream_enabled:
             # Sleep a bit to leave more time to other threads
             time.sleep(InputVideoStream.LOOP_SLEEP)
@@ -80,6 +111,24 @@ class InputVideoStream:
             self.frames.append(frame)
         self.stream.release()
 
+    def _start_decoupled_stream(self):
+        """Grab frames continuously and retrieve only frames that will be consumed."""
+        while self.stream_enabled:
+            # No sleep is needed, grabbing waits for the next frame from the camera
+            grabbed = self.stream.grab()
+            grab_timestamp = time.time()
+            self._refresh_fps()
+            if not grabbed:
+                # Do not spin when the camera is disconnected or the stream has ended
+                time.sleep(InputVideoStream.LOOP_SLEEP)
+                continue
+            if self.frames:
+                # Skip decoding if the consumer is not ready yet
+                continue
+            frame = self.retrieve_frame(grab_timestamp)
+            self.frames.append(frame)
+        self.stream.release()
+
     def stop_stream(self):
         """Stop stream."""
         LOG.debug('Stopping input video stream.')
@@ -91,16 +140,45 @@ class InputVideoStream:
         frame = self._preprocess_frame(frame)
         return frame
 
+    def retrieve_frame(self, timestamp: float) -> Frame:
+        """Return the last grabbed frame from video stream."""
+        frame = Frame(*self.stream.retrieve(), fps=self.fps, frame_count=self.frame_count,
+                      timestamp=timestamp)
+        frame = self._preprocess_frame(frame)
+        return frame
+
     def _preprocess_frame(self, frame: Frame) -> Frame:
         """Preprocess frame before passing it to tracking."""
-        # Decrease image resolution for better performance
-        frame.image = cv2.resize(frame.image, dsize=self.image_size)
+        if self.yuv_capture:
+            frame.image = self._get_ycrcb_image(frame.image)
+            frame.color_space = Frame.YCRCB_COLOR_SPACE
+        else:
+            # Decrease image resolution for better performance
+            frame.image = cv2.resize(frame.image, dsize=self.image_size)
 
         # Flip image so the drummers see themselves as in a mirror
         frame.image = cv2.flip(frame.image, 1)
 
         return frame
 
+    def _get_ycrcb_image(self, image: np.ndarray) -> np.ndarray:
+        """Return YCrCb image of the output size from raw YUY2 image.
+
+        Luma and both chroma channels are resized separately, so the chroma
+        subsampled to half of the width is upsampled by the same resizing.
+        """
+        if image.ndim == 3 and image.shape[2] == 3:
+            # The backend does not support raw capture and decoded the frame anyway
+            return cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2YCrCb), dsize=self.image_size)
+        # Pixels are packed as Y0 U Y1 V, two bytes per pixel
+        luma, chroma = cv2.split(image.reshape(self.input_image_size.height,
+                                               self.input_image_size.width, 2))
+        # Chroma alternates U (Cb) and V (Cr) for pairs of pixels
+        chroma_blue, chroma_red = cv2.split(chroma.reshape(self.input_image_size.height,
+                                                           self.input_image_size.width // 2, 2))
+        return cv2.merge([cv2.resize(channel, dsize=self.image_size)
+                          for channel in (luma, chroma_red, chroma_blue)])
+
     def _refresh_fps(self):
         self.frame_count += 1
         self.fps = self.frame_count / (time.time() - self.stream_start_time)
@@ -114,10 +192,13 @@ class OutputVideoStream:
     #: Sleep interval between outputing two frames [ms]
     LOOP_SLEEP = 10
 
-    def __init__(self, drum_set: 'DrumSet', frames: Deque[Frame] = None):
+    def __init__(self, drum_set: 'DrumSet', frames: Deque[Frame] = None, source: str = None):
         self.stream_enabled = True
         self.frames = frames
         self.drum_set = drum_set
+        #: Key of the displayed capture source (controllers and percussion of other
+        #: sources are not drawn, because they are in different image coordinates)
+        self.source = source
 
     def start_stream(self):
         """Stream frames from the queue to output with added information."""
@@ -138,6 +219,9 @@ class OutputVideoStream:
 
     def _render_frame(self, frame: Frame):
         """Show frame with added FPS, lag, controllers and percussion."""
+        # Only displayed frames are converted from the tracking color space
+        frame.image = frame.get_bgr_image()
+        frame.color_space = Frame.BGR_COLOR_SPACE
         # Show FPS in frame
         cv2.putText(frame.image, f'FPS: {frame.fps:.0f} f/s', (10, 20),
                     **OutputVideoStream.IMAGE_TEXT_PARAMETERS)
@@ -146,17 +230,23 @@ class OutputVideoStream:
         cv2.putText(frame.image, f'Lag: {lag:.2f} s', (10, 40),
                     **OutputVideoStream.IMAGE_TEXT_PARAMETERS)
 
-        # Draw controllers and percussion
+        # Draw controllers at their positions tracked in this frame and percussion
+        positions = (None if frame.tracking_result is None
+                     else dict(frame.tracking_result.positions))
         for controller in self.drum_set.controllers:
-            frame.image = controller.add_controller_position(frame.image)
+            if self.source is None or controller.source == self.source:
+                position = (controller.position if positions is None
+                            else positions.get(controller.key))
+                if position is not None:
+                    frame.image = controller.add_controller_position(frame.image, position)
         for percussion in self.drum_set.percussion:
-            frame.image = percussion.add_percussion_position(frame.image)
+            if self.source is None or percussion.source == self.source:
+                frame.image = percussion.add_percussion_position(frame.image)
 
         # Show the frame in window
         cv2.imshow('Air drums', frame.image)
         # Sleep a bit so the image can be rendered
         key = cv2.waitKey(OutputVideoStream.LOOP_SLEEP)
-        # Stop output steaming. The other threads will terminate automatically
-        # as they are deamon threads.
+        # Stop output steaming. The interface then stops the other threads.
         if key == ord('q'):
             self.stop_stream()
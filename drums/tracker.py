@@ -1,19 +1,37 @@
 """Tracking of controllers."""
 
+import heapq
+import itertools
 import logging
 import time
 from collections import namedtuple
-from typing import Deque, Iterable
+from threading import Lock
+from typing import Callable, Deque, Iterable, List, Optional, Tuple
+
+import cv2
 
 from drums.controllers import Controller
 from drums.drum_set import DrumSet
 from drums.frame import Frame
+from drums.load_shedding import LoadShedder, QualityLevel
+from drums.motion_gate import MotionGate
 
 
 LOG = logging.getLogger(__name__)
 
 
 PositionInTime = namedtuple('Position', 'position timestamp')
+#: Immutable result of tracking one frame of a capture source. The ``positions``
+#: and ``mask_areas`` (number of pixels in the controller's color mask) are tuples
+#: of pairs with controller keys, the ``hits`` are pairs of controller key
+#: and percussion name played after applying the result.
+TrackingResult = namedtuple('TrackingResult',
+                            'sequence timestamp source positions mask_areas hits')
+#: Optional parts of the tracker: adaptive controller of the tracking quality,
+#: merger of positions from several sources (the tracker plays directly if not set),
+#: gate restricting segmentation to moving regions and number of tracker threads
+TrackerOptions = namedtuple('TrackerOptions', 'load_shedder merger motion_gate workers_count',
+                            defaults=(None, None, None, 1))
 
 
 class Tracker:
@@ -23,25 +41,66 @@ class Tracker:
     LOOP_SLEEP = 0.001
 
     def __init__(self, frames_to_track: Deque[Frame],
-                 frames_tracked: Deque[Frame], drum_set: DrumSet):
+                 frames_tracked: Deque[Frame], drum_set: DrumSet,
+                 source: str = None, options: TrackerOptions = TrackerOptions()):
         self.frames_to_track = frames_to_track
         self.frames_tracked = frames_tracked
         self.drum_set = drum_set
         self.tracker_enabled = True
+        #: Key of the tracked capture source (all controllers are tracked if not set)
+        self.source = source
+        #: Tracked controllers
+        self.controllers = (drum_set.controllers if source is None
+                            else drum_set.get_source_items(drum_set.controllers, source))
+        #: Optional parts of the tracker. With several workers, the motion gate compares
+        #: a frame with the frame gated just before it, which does not have to be
+        #: the previous one.
+        self.options = options
+        #: Adaptive controller of the tracking quality. Workers track frames in parallel,
+        #: so each of them has the time budget of several frames.
+        self.load_shedder = options.load_shedder or LoadShedder(
+            LoadShedder.FRAME_TIME_BUDGET * options.workers_count)
+        # Taking frames from the queue and updating the load shedder by workers
+        self._queue_lock = Lock()
+        self._reorderer = ResultReorderer(self._apply_result)
 
     def start_tracker(self):
-        """Start tracking of controllers in frames."""
+        """Start tracking of controllers in frames.
+
+        Several threads can run the tracker at once, each of them is a worker locating
+        controllers in different frames. Frames are numbered when taken from the queue
+        and their results are applied to controllers in this order (see ``ResultReorderer``).
+        A result is submitted for every taken frame, even if its tracking fails
+        (the error is logged and the worker continues with the next frame),
+        so the results of newer frames are never blocked.
+        """
         while self.tracker_enabled:
             # Sleep a bit to leave more time to other threads
             time.sleep(Tracker.LOOP_SLEEP)
             # self._log_queue_lengths()
-            if not self.frames_to_track:
-                continue
-            frame_to_track = self.frames_to_track.popleft()
-            frame_tracked = self.track_controllers_in_frame(
-                frame_to_track, self.drum_set.controllers)
-            self.frames_tracked.append(frame_tracked)
-            self.drum_set.play()
+            with self._queue_lock:
+                if not self.frames_to_track:
+                    continue
+                quality = self.load_shedder.quality
+                if quality.newest_frame_only:
+                    self._drop_stale_frames()
+                frame_to_track = self.frames_to_track.popleft()
+                sequence = self._reorderer.take_sequence()
+            tracking_start_time = time.perf_counter()
+            try:
+                result = self.locate_controllers(frame_to_track, self.controllers, quality,
+                                                 self.options.motion_gate, sequence, self.source)
+            except Exception:  # pylint: disable=broad-except
+                # One failed frame must not stop the worker, the controllers are not found
+                LOG.exception('Tracking of frame %s failed.', frame_to_track.frame_count)
+                result = TrackingResult(
+                    sequence, frame_to_track.timestamp, self.source,
+                    tuple((controller.key, None) for controller in self.controllers),
+                    tuple((controller.key, 0) for controller in self.controllers), ())
+            self._reorderer.submit(frame_to_track, result)
+            with self._queue_lock:
+                self.load_shedder.update(len(self.frames_to_track),
+                                         time.perf_counter() - tracking_start_time)
 
     def stop_tracker(self):
         """Stop tracker."""
@@ -49,17 +108,198 @@ class Tracker:
         self.tracker_enabled = False
 
     @staticmethod
-    def track_controllers_in_frame(frame: Frame, controllers: Iterable[Controller]):
-        """Track controllers in frame by colors tracking."""
+    def track_controllers_in_frame(frame: Frame, controllers: Iterable[Controller],
+                                   quality: QualityLevel = LoadShedder.QUALITY_LEVELS[0],
+                                   motion_gate: MotionGate = None):
+        """Track controllers in frame by colors tracking.
+
+        The ``quality`` level can switch off blurring and decrease the tracking resolution.
+        The ``motion_gate`` can restrict the tracking to moving regions.
+        Positions are always stored in the coordinates of the original frame.
+        """
+        frame.tracking_result = Tracker.locate_controllers(frame, controllers, quality,
+                                                           motion_gate)
+        Tracker.update_controllers(controllers, frame.tracking_result)
+
+        return frame
+
+    @staticmethod
+    def locate_controllers(frame: Frame, controllers: Iterable[Controller],
+                           quality: QualityLevel = LoadShedder.QUALITY_LEVELS[0],
+                           motion_gate: MotionGate = None, sequence: int = None,
+                           source: str = None) -> TrackingResult:
+        """Return result with controllers positions in frame without updating controllers."""
+        positions = []
+        mask_areas = []
+        frame_to_track = frame
+        if quality.tracking_scale != 1:
+            frame_to_track = Frame(
+                frame.grabbed,
+                cv2.resize(frame.image, None, fx=quality.tracking_scale,
+                           fy=quality.tracking_scale, interpolation=cv2.INTER_AREA),
+                fps=frame.fps, frame_count=frame.frame_count, timestamp=frame.timestamp,
+                color_space=frame.color_space)
+
+        regions = None
+        if motion_gate is not None:
+            regions = motion_gate.get_regions(frame_to_track, controllers,
+                                              quality.tracking_scale)
+
         for controller in controllers:
-            mask = controller.get_controller_mask(frame)
-            position = controller.get_largest_contour_center(mask)
-            position_in_time = PositionInTime(position, frame.timestamp)
+            if regions is None:
+                mask = controller.get_controller_mask(frame_to_track, blur=quality.blur)
+            else:
+                mask = motion_gate.get_controller_mask(controller, frame_to_track, regions,
+                                                       blur=quality.blur)
+            position = controller.get_blob_center(mask, quality.tracking_scale)
+            if position is not None and quality.tracking_scale != 1:
+                position = (int(position[0] / quality.tracking_scale),
+                            int(position[1] / quality.tracking_scale))
+            positions.append((controller.key, position))
+            mask_areas.append((controller.key, cv2.countNonZero(mask)))
+
+        return TrackingResult(sequence, frame.timestamp, source, tuple(positions),
+                              tuple(mask_areas), ())
+
+    @staticmethod
+    def update_controllers(controllers: Iterable[Controller], result: TrackingResult):
+        """Update motion attributes of controllers with their positions in the result."""
+        positions = dict(result.positions)
+        for controller in controllers:
+            if controller.key not in positions:
+                continue
+            position_in_time = PositionInTime(positions[controller.key], result.timestamp)
             controller.positions_in_time.append(position_in_time)
             controller.refresh_motion_attributes()
 
-        return frame
+    def _apply_result(self, frame: Frame, result: TrackingResult):
+        """Update controllers and play the drum set (or pass the result to the merger)."""
+        if self.options.merger is None:
+            self.update_controllers(self.controllers, result)
+            hits = self.drum_set.play(self.controllers)
+            frame.tracking_result = result._replace(hits=tuple(hits))
+        else:
+            # The merger replaces the result with the one with hits when it plays the result
+            frame.tracking_result = result
+            self.options.merger.add_result(result, frame)
+        self.frames_tracked.append(frame)
+
+    def _drop_stale_frames(self):
+        """Drop all frames waiting for tracking except the newest one."""
+        # Pop from the left only, the input stream can append new frames meanwhile
+        dropped_count = 0
+        while len(self.frames_to_track) > 1:
+            self.frames_to_track.popleft()
+            dropped_count += 1
+        if dropped_count:
+            self.load_shedder.frames_dropped += dropped_count
+            LOG.debug('Dropped %s stale frames (%s in total).',
+                      dropped_count, self.load_shedder.frames_dropped)
 
     def _log_queue_lengths(self):
         LOG.debug('Frames to track: %s.', len(self.frames_to_track))
         LOG.debug('Frames tracked: %s.', len(self.frames_tracked))
+
+
+class ResultReorderer:
+    """Reorder stage applying results of frames tracked by several workers in frame order.
+
+    Frames are numbered by ``take_sequence`` when taken from the queue. A submitted result
+    is held until the results of all older frames are applied. The worker that submits
+    the oldest pending result applies all consecutive results.
+    """
+
+    def __init__(self, apply_result: Callable[[Frame, TrackingResult], None]):
+        #: Function applying the result of the frame
+        self.apply_result = apply_result
+        self._sequences = itertools.count()
+        # Results submitted by workers, waiting for the results of older frames
+        self._lock = Lock()
+        self._pending_results = {}
+        self._next_sequence = 0
+
+    def take_sequence(self) -> int:
+        """Return sequence number of the next frame taken from the queue."""
+        return next(self._sequences)
+
+    def submit(self, frame: Frame, result: TrackingResult):
+        """Submit result of the frame and apply all results that are in order."""
+        with self._lock:
+            self._pending_results[result.sequence] = (frame, result)
+            while self._next_sequence in self._pending_results:
+                frame, result = self._pending_results.pop(self._next_sequence)
+                self._next_sequence += 1
+                self.apply_result(frame, result)
+
+
+class TimestampMerger:
+    """Merger of controllers positions tracked in several capture sources.
+
+    Trackers of all sources add their results, the merger applies them
+    to controllers and plays the drum set in the order of frame timestamps.
+    Positions are held until all sources have tracked a frame at least as new,
+    but never longer than ``ALIGNMENT_WINDOW``, so a stalled source cannot block others.
+    """
+
+    #: Maximal time for holding positions to align them with other sources [s]
+    ALIGNMENT_WINDOW = 1 / 30
+    #: Sleep interval between two merges
+    LOOP_SLEEP = 0.001
+
+    def __init__(self, drum_set: DrumSet, sources: Iterable[str]):
+        self.drum_set = drum_set
+        self.merger_enabled = True
+        #: Timestamps of the newest frames tracked in each source
+        self.latest_timestamps = {source: 0 for source in sources}
+        # Heap with (timestamp, sequence, arrival time, result, frame)
+        self._results_heap = []
+        self._sequence = itertools.count()
+        self._lock = Lock()
+
+    def add_result(self, result: TrackingResult, frame: Frame = None):
+        """Add result of tracking a frame of a capture source.
+
+        The result with hits replaces the ``tracking_result`` of the ``frame``
+        when the result is played.
+        """
+        with self._lock:
+            heapq.heappush(self._results_heap,
+                           (result.timestamp, next(self._sequence), time.time(), result, frame))
+            self.latest_timestamps[result.source] = max(
+                self.latest_timestamps[result.source], result.timestamp)
+
+    def start_merger(self):
+        """Start merging of positions from all capture sources."""
+        while self.merger_enabled:
+            # Sleep a bit to leave more time to other threads
+            time.sleep(TimestampMerger.LOOP_SLEEP)
+            self.merge_positions()
+
+    def stop_merger(self):
+        """Stop merger."""
+        LOG.debug('Stopping merger.')
+        self.merger_enabled = False
+
+    def merge_positions(self):
+        """Apply all aligned positions to controllers and play the drum set in time order."""
+        for result, frame in self._pop_aligned_results():
+            controllers = self.drum_set.get_source_items(self.drum_set.controllers,
+                                                         result.source)
+            Tracker.update_controllers(controllers, result)
+            hits = self.drum_set.play(controllers)
+            if frame is not None:
+                frame.tracking_result = result._replace(hits=tuple(hits))
+
+    def _pop_aligned_results(self) -> List[Tuple[TrackingResult, Optional[Frame]]]:
+        aligned_results = []
+        current_time = time.time()
+        with self._lock:
+            watermark = min(self.latest_timestamps.values())
+            while self._results_heap:
+                timestamp, _, arrival_time, result, frame = self._results_heap[0]
+                if (timestamp > watermark
+                        and current_time - arrival_time < TimestampMerger.ALIGNMENT_WINDOW):
+                    break
+                heapq.heappop(self._results_heap)
+                aligned_results.append((result, frame))
+        return aligned_results
@@ -3,7 +3,9 @@
 import argparse
 import logging
 
-from drums.interface import Interface
+from drums.event_bus import SOCKET_PATH
+from drums.interface import Interface, InterfaceOptions
+from drums.profiling import ThreadProfiler
 from drums.settings import Settings
 
 
@@ -16,6 +18,20 @@ def parse_arguments():
     parser.add_argument('-s', '--settings_file_path',
                         default='./settings/drum_set_basic.yaml',
                         help='Relative path to the setting file.')
+    parser.add_argument('-d', '--decoupled_capture', action='store_true',
+                        help='Decode only the latest camera frame when the tracker is ready.')
+    parser.add_argument('-p', '--profile_directory', default=None,
+                        help='Profile all threads and write their stats to this directory.')
+    parser.add_argument('-m', '--motion_gate', action='store_true',
+                        help='Track controllers only in moving regions of the image.')
+    parser.add_argument('-e', '--event_socket_path', nargs='?', const=SOCKET_PATH,
+                        default=None,
+                        help='Publish hit and position events to this Unix socket '
+                             f'(default {SOCKET_PATH}).')
+    parser.add_argument('-w', '--tracker_workers', type=int, default=1,
+                        help='Number of threads tracking controllers in frames.')
+    parser.add_argument('-y', '--yuv_capture', action='store_true',
+                        help='Capture raw YUV frames and track controllers in YCrCb.')
 
     parsed_arguments = parser.parse_args()
     arguments = vars(parsed_arguments)
@@ -27,7 +43,16 @@ def start_interface():
     arguments = parse_arguments()
     settings = Settings(arguments['settings_file_path'])
 
-    interface = Interface(settings)
+    profiler = None
+    if arguments['profile_directory']:
+        profiler = ThreadProfiler(arguments['profile_directory'])
+
+    options = InterfaceOptions(decoupled_capture=arguments['decoupled_capture'],
+                               profiler=profiler, motion_gate=arguments['motion_gate'],
+                               event_socket_path=arguments['event_socket_path'],
+                               tracker_workers_count=arguments['tracker_workers'],
+                               yuv_capture=arguments['yuv_capture'])
+    interface = Interface(settings, options=options)
     interface.start_interface()
 
 
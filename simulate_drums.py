@@ -0,0 +1,103 @@
+"""Evaluate tracking and playing of air drums on a synthetic scene without camera."""
+
+import argparse
+import logging
+import sys
+
+from drums.drum_set import DrumSet
+from drums.load_shedding import LoadShedder
+from drums.motion_gate import MotionGate
+from drums.settings import Settings
+from drums.simulation import (SceneParameters, StrokeParameters, StubAudioSink, SyntheticScene,
+                              create_strokes, run_simulation)
+from drums.streaming import ImageSize
+
+
+LOGGING_LEVEL = logging.WARNING
+
+
+def parse_arguments():
+    """Return parsed command line arguments as dictionary."""
+    quality_names = [quality.name for quality in LoadShedder.QUALITY_LEVELS]
+    parser = argparse.ArgumentParser(description='Air drums simulation argument parser.')
+    parser.add_argument('-s', '--settings_file_path',
+                        default='./settings/drum_set_basic.yaml',
+                        help='Relative path to the setting file.')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='Duration of the scene [s].')
+    parser.add_argument('--interval', type=float, default=0.6,
+                        help='Interval between two strokes of a controller [s].')
+    parser.add_argument('--stroke_duration', type=float, default=0.2,
+                        help='Duration of a normal stroke [s].')
+    parser.add_argument('--fast_stroke_duration', type=float, default=0.05,
+                        help='Duration of a fast stroke [s].')
+    parser.add_argument('--fast_strokes_ratio', type=float, default=0.25,
+                        help='Ratio of fast strokes.')
+    parser.add_argument('--background', choices=SyntheticScene.BACKGROUNDS, default='texture',
+                        help='Background of the scene.')
+    parser.add_argument('--noise', type=float, default=5,
+                        help='Standard deviation of the image noise.')
+    parser.add_argument('--image_size', type=int, nargs=2, default=[640, 480],
+                        metavar=('WIDTH', 'HEIGHT'), help='Size of the camera image.')
+    parser.add_argument('--quality', choices=quality_names, default=quality_names[0],
+                        help='Tracking quality level.')
+    parser.add_argument('--motion_gate', action='store_true',
+                        help='Track controllers only in moving regions of the image.')
+    parser.add_argument('--yuv_capture', action='store_true',
+                        help='Track controllers in YCrCb as with raw YUV capture.')
+    parser.add_argument('--decoded_frames', action='store_true',
+                        help='With --yuv_capture, output decoded BGR frames as by a camera '
+                             'without raw YUV support.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random generator.')
+    parser.add_argument('--max_error_ratio', type=float, default=None,
+                        help='Fail if missed and false hits exceed this ratio of true hits.')
+
+    parsed_arguments = parser.parse_args()
+    arguments = vars(parsed_arguments)
+    return arguments
+
+
+def start_simulation() -> bool:
+    """Run simulation with parsed arguments, print report and return if it passed."""
+    arguments = parse_arguments()
+    settings = Settings(arguments['settings_file_path'])
+    audio_sink = StubAudioSink()
+    drum_set = DrumSet(settings, audio_sink=audio_sink)
+
+    strokes = create_strokes([controller.key for controller in drum_set.controllers],
+                             [percussion.name for percussion in drum_set.percussion],
+                             StrokeParameters(arguments['duration'], arguments['interval'],
+                                              arguments['stroke_duration'],
+                                              arguments['fast_stroke_duration'],
+                                              arguments['fast_strokes_ratio'],
+                                              arguments['seed']))
+    scene = SyntheticScene(drum_set, strokes,
+                           SceneParameters(ImageSize(*arguments['image_size']),
+                                           background=arguments['background'],
+                                           noise=arguments['noise'], seed=arguments['seed'],
+                                           yuy2_output=(arguments['yuv_capture']
+                                                        and not arguments['decoded_frames'])))
+    quality = next(quality for quality in LoadShedder.QUALITY_LEVELS
+                   if quality.name == arguments['quality'])
+
+    motion_gate = MotionGate() if arguments['motion_gate'] else None
+
+    if arguments['yuv_capture']:
+        scene.calibrate_ycrcb()
+
+    report = run_simulation(drum_set, scene, audio_sink, quality, motion_gate,
+                            arguments['yuv_capture'])
+    for field, value in report._asdict().items():
+        print(f'{field:>20}: {value:.3f}' if isinstance(value, float)
+              else f'{field:>20}: {value}')
+
+    if arguments['max_error_ratio'] is None:
+        return True
+    errors_count = report.missed_hits_count + report.false_hits_count
+    return errors_count <= arguments['max_error_ratio'] * report.true_hits_count
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=LOGGING_LEVEL)
+    sys.exit(0 if start_simulation() else 1)
@@ -0,0 +1,64 @@
+"""Subscribe to hit and position events of running air drums and measure their latency."""
+
+import argparse
+import logging
+
+import numpy as np
+
+from drums.event_bus import (SOCKET_PATH, DescriptionEvent, EventSubscriber, HitEvent,
+                             PositionsEvent)
+
+
+LOGGING_LEVEL = logging.INFO
+LOG = logging.getLogger(__name__)
+
+
+def parse_arguments():
+    """Return parsed command line arguments as dictionary."""
+    parser = argparse.ArgumentParser(description='Air drums events subscriber.')
+    parser.add_argument('-e', '--event_socket_path', default=SOCKET_PATH,
+                        help='Path of the socket of the air drums events publisher.')
+    parser.add_argument('-n', '--report_interval', type=int, default=100,
+                        help='Number of position events between two latency reports.')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Do not log each hit.')
+
+    parsed_arguments = parser.parse_args()
+    arguments = vars(parsed_arguments)
+    return arguments
+
+
+def start_subscriber():
+    """Log received hits and latency of the events from the frame capture."""
+    arguments = parse_arguments()
+    subscriber = EventSubscriber(arguments['event_socket_path'])
+    controller_keys, percussion_names = [], []
+    latencies = []
+    try:
+        for event, receive_time in subscriber.receive_events():
+            if isinstance(event, DescriptionEvent):
+                controller_keys, percussion_names = event
+                LOG.info('Subscribed to controllers %s and percussion %s.',
+                         controller_keys, percussion_names)
+            elif isinstance(event, HitEvent):
+                if not arguments['quiet'] and controller_keys:
+                    LOG.info('Hit of %s by %s, volume %s, latency %.1f ms.',
+                             percussion_names[event.percussion_index],
+                             controller_keys[event.controller_index], event.volume,
+                             (receive_time - event.timestamp) * 1000)
+            elif isinstance(event, PositionsEvent):
+                latencies.append(receive_time - event.timestamp)
+                if len(latencies) >= arguments['report_interval']:
+                    LOG.info('Latency from capture of %s frames: mean %.1f ms, max %.1f ms.',
+                             len(latencies), np.mean(latencies) * 1000,
+                             np.max(latencies) * 1000)
+                    latencies = []
+    except KeyboardInterrupt:
+        pass
+    finally:
+        subscriber.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=LOGGING_LEVEL)
+    start_subscriber()